@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+#
+# benchmark.py, mät tid, genomströmning och minne för beräkningen och processerna
+#
+# Genererar syntetiska indata i en katalog: en excelfil med "Transaktioner"
+# och "Inbalans" samt exporter från crypto.com, Nexo och Gnosis. Exporterna
+# är giltiga hela vägen genom beräkningen: varje generator säljer bara ur sitt
+# eget innehav och inbalansen har alla valutor som processerna skriver, så
+# katalogen kan också köras med pipeline.py (med coinlist.json). Varje steg
+# körs sedan i en egen process (spawn) så att högsta RSS gäller just det
+# steget. Kurserna kommer från en stub (valuta.http_get) istället för nätet
+# och kurscachen är tom från början, så prefetch() räknas med.
+#
+# Exempel:
+#   benchmark.py --rader 10000
+#   benchmark.py --rader 1000000 --endast bok --json bench.json
+
+import sys, os, csv, json, math, time, random, argparse, contextlib
+import datetime, urllib.parse, multiprocessing, tempfile
+import concurrent.futures
+
+JOBB = ["bok", "crypto_com", "nexo", "gnosis"]
+
+COINS = ["BTC", "ETH", "ADA", "DOT", "CRO", "SOL", "LINK", "XRP", "LTC", "AVAX"]
+GNOSIS_SYMBOLER = ["GNO", "WXDAI", "CRC", "USDC", "COW", "SAFE"]
+START = datetime.datetime(2021, 1, 1)
+
+# Varje generators startinnehav per valuta. Inbalansen har plats för allas.
+INNEHAV = 100.0
+
+def tidpunkt(i, n):
+    """Tidpunkt för rad i av n, jämnt utspridda över ett år"""
+    return START + datetime.timedelta(seconds=i * (365 * 86400 // max(n, 1)))
+
+def startinnehav(valuta):
+    """INNEHAV i loggens enhet, BTC och ETH blir mBTC och mETH i beräkningen"""
+    return INNEHAV / 1000 if valuta in ("BTC", "ETH") else INNEHAV
+
+class Innehav(dict):
+    """En generators innehav per valuta, i loggens enhet"""
+    def __missing__(self, valuta):
+        return startinnehav(valuta)
+
+def köpantal(valuta, slump):
+    return round(slump.uniform(0.01, 10) * startinnehav(valuta) / INNEHAV, 8)
+
+def säljantal(innehav, slump, decimaler=8):
+    """Högst halva innehavet, avrundat nedåt så att innehavet aldrig blir
+    negativt"""
+    skala = 10 ** decimaler
+    return math.floor(innehav * slump.uniform(0.01, 0.5) * skala) / skala
+
+def inbalansvalutor():
+    """Alla valutor som boken och processerna för de genererade loggarna
+    skriver: mynten, crypto.com:s earn-valutor, Nexos valutor och tokens"""
+    mynt = ["mBTC" if c == "BTC" else "mETH" if c == "ETH" else c for c in COINS]
+    return (mynt + ["crypto" + c for c in COINS] + ["NEXO"]
+            + ["nexo" + c for c in COINS + ["NEXO"]] + GNOSIS_SYMBOLER)
+
+#
+# Generatorer
+#
+
+def generera_bok(filnamn, n, slump):
+    """Excelfil med n transaktionsrader och en inbalans för alla valutor i
+    inbalansvalutor(). Innehavet blir aldrig negativt, inte heller när
+    processernas transaktioner läggs till. Var tionde rad är en
+    fortsättningsrad utan datum och var, som processerna skriver vid
+    växlingar."""
+    import openpyxl
+    valutor = ["mBTC" if c == "BTC" else "mETH" if c == "ETH" else c for c in COINS]
+    wb = openpyxl.Workbook(write_only=True)
+    wi = wb.create_sheet("Inbalans")
+    wi.append(["Inbalans"])
+    wi.append([])
+    wi.append(["Namn", "Enhet", "Innehav", "GOB"])
+    for v in inbalansvalutor():
+        wi.append([v.lower(), v, INNEHAV * len(JOBB), 10.0])
+    wt = wb.create_sheet("Transaktioner")
+    wt.append(["Transaktioner"])
+    wt.append([])
+    wt.append(["Datum", "Var", "Händelse", "Antal", "Valuta", "Belopp"])
+    innehav = dict.fromkeys(valutor, INNEHAV)
+    for i in range(n):
+        v = slump.choice(valutor)
+        händelse = slump.choice(["köp", "köp", "sälj", "sälj", "ränta", "kapitalinkomst"])
+        if händelse == "sälj":
+            antal = -round(innehav[v] * slump.uniform(0, 0.5), 6)
+        else:
+            antal = round(slump.uniform(0.01, 20), 6)
+        innehav[v] += antal
+        belopp = round(slump.uniform(1, 5000), 2)
+        if i % 10 == 9:
+            wt.append([None, None, händelse, antal, v, belopp])
+        else:
+            wt.append([tidpunkt(i, n), slump.choice(["binance", "coinbase", "kraken"]),
+                       händelse, antal, v, belopp])
+    wb.save(filnamn)
+
+def generera_crypto_com(filnamn, n, slump):
+    """Crypto.com-export med n rader, senaste transaktionen först. Antal och
+    USD har de tecken som process_crypto_com.py förväntar sig per typ."""
+    import process_crypto_com as p
+    typer = (p.POLICY_GIFT + p.POLICY_INTEREST * 4 + p.POLICY_OTHER * 2 + p.POLICY_IGNORE)
+    köp = p.POLICY_GIFT + p.POLICY_INTEREST + ["crypto_payment_refund", "nft_payout_credited"]
+    sälj = ["crypto_earn_program_created", "crypto_exchange", "crypto_viban_exchange",
+            "crypto_payment", "card_top_up"]
+    innehav = Innehav()
+    rader = []
+    for i in range(n):
+        typ = slump.choice(typer)
+        valuta = slump.choice(COINS)
+        till, tillantal = "", ""
+        usd = round(slump.uniform(0.01, 2000), 2)
+        if typ in köp:
+            antal = köpantal(valuta, slump)
+            innehav[valuta] += antal
+        elif typ in sälj:
+            antal = -säljantal(innehav[valuta], slump)
+            innehav[valuta] += antal
+            if typ == "crypto_earn_program_created":
+                innehav["crypto" + valuta] -= antal
+            elif typ == "crypto_exchange":
+                till = slump.choice(COINS)
+                tillantal = köpantal(till, slump)
+                innehav[till] += tillantal
+            elif typ == "card_top_up":
+                usd = -usd      # beloppet byter tecken i processen
+        elif typ == "crypto_earn_program_withdrawn":
+            antal = säljantal(innehav["crypto" + valuta], slump)
+            innehav["crypto" + valuta] -= antal
+            innehav[valuta] += antal
+        elif typ in ("viban_purchase", "recurring_buy_order"):
+            valuta, antal = "EUR", -round(usd * 0.9, 2)
+            till = slump.choice(COINS)
+            tillantal = köpantal(till, slump)
+            innehav[till] += tillantal
+        else:
+            antal = round(slump.uniform(-10, 10), 8)    # hoppas över
+        rader.append([tidpunkt(i, n).strftime("%Y-%m-%d %H:%M:%S"), typ.replace("_", " ").title(),
+                      valuta, antal, till, tillantal, "SEK", round(usd * 9, 2), usd, typ, ""])
+    with open(filnamn, "w", newline='', encoding='utf-8') as f:
+        w = csv.writer(f, lineterminator="\n")
+        w.writerow(["Timestamp (UTC)", "Transaction Description", "Currency", "Amount",
+                    "To Currency", "To Amount", "Native Currency", "Native Amount",
+                    "Native Amount (in USD)", "Transaction Kind", "Transaction Hash"])
+        w.writerows(reversed(rader))
+
+def generera_nexo(filnamn, n, slump):
+    """Nexo-export med n rader, senaste transaktionen först. Antalen har de
+    tecken som process_nexo.py förväntar sig per typ."""
+    import process_nexo as p
+    typer = p.POLICY_GIFT + p.POLICY_INTEREST * 4 + p.POLICY_OTHER + p.POLICY_IGNORE
+    innehav = Innehav()
+    rader = []
+    for i in range(n):
+        typ = slump.choice(typer)
+        valuta = slump.choice(COINS + ["NEXONEXO"])
+        v = "NEXO" if valuta == "NEXONEXO" else valuta
+        till = slump.choice(COINS)
+        antal, tillantal = köpantal(v, slump), köpantal(till, slump)
+        if typ in p.POLICY_GIFT or typ in p.POLICY_INTEREST:
+            innehav["nexo" + v] += antal
+        elif typ in ("Deposit", "Top up Crypto", "Transfer From Pro Wallet"):
+            antal = säljantal(innehav[v], slump)
+            innehav[v] -= antal
+            innehav["nexo" + v] += antal
+        elif typ in ("Withdrawal", "Transfer To Pro Wallet"):
+            antal = -säljantal(innehav["nexo" + v], slump)
+            innehav["nexo" + v] += antal
+            innehav[v] -= antal
+        elif typ == "Deposit To Exchange":
+            innehav["nexo" + till] += tillantal
+        elif typ == "Exchange":
+            antal = -säljantal(innehav["nexo" + v], slump)
+            innehav["nexo" + v] += antal
+            innehav["nexo" + till] += tillantal
+        rader.append(["NXT%09d" % i, typ, valuta, antal, till, tillantal,
+                      "$%.2f" % slump.uniform(0.01, 2000), "-", "-", "approved / " + typ,
+                      tidpunkt(i, n).strftime("%Y-%m-%d %H:%M:%S")])
+    with open(filnamn, "w", newline='', encoding='utf-8') as f:
+        w = csv.writer(f, lineterminator="\n")
+        w.writerow(["Transaction", "Type", "Input Currency", "Input Amount", "Output Currency",
+                    "Output Amount", "USD Equivalent", "Fee", "Fee Currency", "Details",
+                    "Date / Time (UTC)"])
+        w.writerows(reversed(rader))
+
+def generera_gnosis(filnamn, n, slump):
+    """Gnosis-export med ungefär n rader, 1-4 tokenrörelser per transaktion
+    till eller från MY_ADDRESS, äldst först. En transaktion har olika tokens
+    på varje rad, och i swappar säljs bara ur innehavet."""
+    from process_gnosiswallet_config import MY_ADDRESS
+    innehav = Innehav()
+    with open(filnamn, "w", newline='', encoding='utf-8') as f:
+        w = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator="\n")
+        w.writerow(["Transaction Hash", "Blockno", "UnixTimestamp", "DateTime (UTC)", "From", "To",
+                    "TokenValue", "USDValueDayOfTx", "ContractAddress", "TokenName", "TokenSymbol"])
+        i = tx = 0
+        while i < n:
+            t = tidpunkt(i, n)
+            rörelser = []
+            for j, sym in enumerate(slump.sample(GNOSIS_SYMBOLER, min(slump.randint(1, 4), n - i))):
+                in_ = j % 2 == 1
+                antal = round(slump.uniform(0.01, 2000), 6)
+                if not in_:
+                    antal = säljantal(innehav[sym], slump, 6)
+                rörelser.append((sym, in_, antal))
+            # Bara swappar (in och ut) blir transaktioner i processen
+            if any(in_ for _, in_, _ in rörelser) and any(not in_ and a > 0 for _, in_, a in rörelser):
+                for sym, in_, antal in rörelser:
+                    innehav[sym] += antal if in_ else -antal
+            for sym, in_, antal in rörelser:
+                usd = slump.choice(["N/A", "$%.2f" % slump.uniform(0.01, 3000)])
+                w.writerow(["0x%064x" % tx, 20000000 + tx, int(t.timestamp()),
+                            t.strftime("%Y-%m-%d %H:%M:%S"),
+                            "0x" + "1" * 40 if in_ else MY_ADDRESS,
+                            MY_ADDRESS if in_ else "0x" + "1" * 40,
+                            "{:,}".format(antal), usd, "0x" + "c" * 40, sym, sym])
+                i += 1
+            tx += 1
+
+GENERATORER = {
+    "bok": ("bok.xlsx", generera_bok),
+    "crypto_com": ("crypto_com.csv", generera_crypto_com),
+    "nexo": ("nexo.csv", generera_nexo),
+    "gnosis": ("gnosis.csv", generera_gnosis),
+}
+
+#
+# Kursstub, svarar som currencybeacon och coingecko med påhittade kurser
+#
+
+class StubSvar:
+    def __init__(self, data):
+        self.data = data
+        self.status_code = 200
+        self.headers = {}
+
+    def json(self):
+        return self.data
+
+def stubkurs(dag, bas):
+    return bas + dag.toordinal() % 100 / 100
+
+def stub_get(url):
+    u = urllib.parse.urlparse(url)
+    q = dict(urllib.parse.parse_qsl(u.query))
+    if u.path.endswith("/timeseries"):
+        dag = datetime.date.fromisoformat(q["start_date"])
+        slut = datetime.date.fromisoformat(q["end_date"])
+        kurser = {}
+        while dag <= slut:
+            kurser[dag.isoformat()] = {"SEK": stubkurs(dag, 8)}
+            dag += datetime.timedelta(days=1)
+        return StubSvar({"response": kurser})
+    if u.path.endswith("/historical"):
+        dag = datetime.date.fromisoformat(q["date"])
+        return StubSvar({"response": {"rates": {"SEK": stubkurs(dag, 8)}}})
+    if u.path.endswith("/latest"):
+        return StubSvar({"response": {"rates": {"SEK": 10.0}}})
+    if "/market_chart/range" in u.path:
+        t0, t1 = int(q["from"]), int(q["to"])
+        return StubSvar({"prices": [[t * 1000, stubkurs(datetime.date.fromtimestamp(t), 100)]
+                                    for t in range(t0, t1, 86400)]})
+    if u.path.endswith("/history"):
+        dag = datetime.datetime.strptime(q["date"], "%d-%m-%Y").date()
+        return StubSvar({"market_data": {"current_price": {"usd": stubkurs(dag, 100)}}})
+    if "simple/price" in u.path:
+        return StubSvar({q["ids"]: {"usd": 100.0}})
+    return StubSvar({})
+
+def installera_stub(katalog):
+    """Kurser från stubben, tom kurscache i katalogen och ingen väntan"""
+    import valuta
+    valuta.http_get = stub_get
+    valuta._buckets = {l: valuta.TokenBucket(1e9, 1e9) for l in valuta.KVOTER}
+    valuta.CACHEFILE = os.path.join(katalog, "valutor.json")
+    valuta.COINLIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), valuta.COINLIST)
+    if os.path.exists(valuta.CACHEFILE):
+        os.remove(valuta.CACHEFILE)
+
+#
+# Mätningar, körs i egna processer
+#
+
+class Tidtagare:
+    def __init__(self):
+        self.steg = []
+        self.t = time.perf_counter()
+
+    def klart(self, namn, rader):
+        nu = time.perf_counter()
+        self.steg.append((namn, rader, nu - self.t))
+        self.t = nu
+
+def mät_bok(katalog):
+    import kryptodeklaration as kd
+    tt = Tidtagare()
+    with open(os.devnull, "w") as tyst, contextlib.redirect_stdout(tyst):
+        kalkfil = kd.Kalkfil(os.path.join(katalog, "bok.xlsx"), os.path.join(katalog, "ut.xlsx"))
+        balans = kd.read_inbalans(kalkfil.sheetI)
+        translist = kd.read_transactions(kalkfil.sheetT)
+        n = len(translist)
+        tt.klart("read_transactions", n)
+        transtable = kd.sort_check_transactions(balans, translist)
+        tt.klart("sort_check_transactions", n)
+        resultat = kd.beräkna(balans, transtable)
+        tt.klart("beräkna", n)
+        kd.output_results(kalkfil.sheetR, resultat)
+        tt.klart("output_results", n)
+        kd.output_utbalans(kalkfil.sheetU, balans)
+        tt.klart("output_utbalans", len(balans))
+        kalkfil.save()
+        tt.klart("save", n)
+    return tt.steg
+
+def mät_process(modulnamn, loggfil, katalog, n):
+    import importlib
+    installera_stub(katalog)
+    modul = importlib.import_module(modulnamn)
+    tt = Tidtagare()
+    with open(os.devnull, "w") as tyst, contextlib.redirect_stdout(tyst):
+        modul.processfile(loggfil, os.path.join(katalog, "resultat_" + modulnamn + ".csv"))
+    tt.klart("processfile", n)
+    return tt.steg
+
+def kör_jobb(jobb, katalog, n):
+    """Körs i en egen process. Returnerar (steg, högsta RSS i MB eller None)."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import tidtagning
+    if jobb == "bok":
+        steg = mät_bok(katalog)
+    else:
+        loggfil = os.path.join(katalog, GENERATORER[jobb][0])
+        steg = mät_process("process_" + jobb.replace("gnosis", "gnosiswallet"), loggfil, katalog, n)
+    return steg, tidtagning.max_rss_mb()
+
+def i_egen_process(funktion, *args):
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=ctx) as pool:
+        return pool.submit(funktion, *args).result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Mät beräkningen och processerna på syntetiska data")
+    parser.add_argument("--rader", type=int, default=10000, help="antal rader per indatafil")
+    parser.add_argument("--endast", choices=JOBB, action="append",
+                        help="kör bara detta jobb (kan anges flera gånger)")
+    parser.add_argument("--katalog", help="katalog för genererade filer (annars en temporär)")
+    parser.add_argument("--frö", type=int, default=1, help="frö för slumptalen")
+    parser.add_argument("--json", metavar="FIL", help="spara mätningarna som json")
+    args = parser.parse_args()
+
+    jobblista = args.endast or JOBB
+    katalog = args.katalog or tempfile.mkdtemp(prefix="kryptobench")
+    os.makedirs(katalog, exist_ok=True)
+
+    print("Genererar", args.rader, "rader per fil i", katalog)
+    for jobb in jobblista:
+        filnamn, generator = GENERATORER[jobb]
+        t = time.perf_counter()
+        generator(os.path.join(katalog, filnamn), args.rader, random.Random(args.frö))
+        print("  %-14s %8.2f s" % (filnamn, time.perf_counter() - t))
+
+    print()
+    print("%-36s %10s %9s %12s %9s" % ("Steg", "Rader", "Tid s", "Rader/s", "RSS MB"))
+    mätningar = []
+    for jobb in jobblista:
+        steg, rss = i_egen_process(kör_jobb, jobb, katalog, args.rader)
+        for namn, rader, tid in steg:
+            print("%-36s %10d %9.2f %12.0f %9s" % (jobb + ": " + namn, rader, tid,
+                                                    rader / tid if tid > 0 else 0, ""))
+            mätningar.append({"jobb": jobb, "steg": namn, "rader": rader, "tid": tid})
+        print("%-36s %10s %9s %12s %9s" % (jobb + ": högsta RSS", "", "", "",
+                                              "" if rss is None else "%.0f" % rss))
+        mätningar.append({"jobb": jobb, "steg": "max_rss_mb", "värde": rss})
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rader": args.rader, "mätningar": mätningar}, f, ensure_ascii=False, indent=1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#
+# Läs transaktionsloggar (csv) från börserna rad för rad
+#
+# Loggarna från crypto.com och Nexo har senaste transaktionen först.
+# rader_kronologiskt() läser filen bakifrån i block så att raderna kommer
+# i tidsordning utan att hela filen behöver läsas in i minnet.
+#
+# OBS: fält med radbrytning inom citattecken stöds inte vid läsning bakifrån,
+# varje rad i filen tolkas som en transaktion.
+
+import csv
+
+BLOCKSTORLEK = 1 << 16
+
+def rader(filnamn):
+    """Returnera loggens rader som listor med fält, i filordning, utan rubrikraden"""
+    with open(filnamn, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # skip header line
+        for row in reader:
+            if row:
+                yield row
+
+def rader_kronologiskt(filnamn):
+    """Returnera loggens rader som listor med fält, sista raden i filen först,
+    utan rubrikraden. Minnesåtgången beror inte på filens storlek."""
+    with open(filnamn, "rb") as f:
+        f.readline()  # skip header line
+        start = f.tell()
+    textrader = (rad.decode("utf-8") for rad in rader_baklänges(filnamn, start))
+    for row in csv.reader(textrader):
+        if row:
+            yield row
+
+def rader_baklänges(filnamn, start=0, blockstorlek=BLOCKSTORLEK):
+    """Läs filen från slutet ner till byte start i block om blockstorlek.
+    Returnerar raderna (bytes, utan radslut) sista raden först."""
+    with open(filnamn, "rb") as f:
+        pos = f.seek(0, 2)
+        rest = b""
+        while pos > start:
+            n = min(blockstorlek, pos - start)
+            pos -= n
+            f.seek(pos)
+            delar = (f.read(n) + rest).split(b"\n")
+            # Första delen kan vara en ofullständig rad, spara till nästa block
+            rest = delar[0]
+            for rad in reversed(delar[1:]):
+                yield rad.rstrip(b"\r")
+        yield rest.rstrip(b"\r")
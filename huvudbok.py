@@ -0,0 +1,135 @@
+#
+# Transaktionslistan (huvudboken) som Parquet eller Arrow
+#
+# Samma kolumner som fliken Transaktioner: Datum, Var, Händelse, Antal,
+# Valuta och Belopp, efter normaliseringen i read_transaction_rows (mBTC,
+# mETH, ifyllda datum och var). Var, Händelse och Valuta lagras
+# ordlistekodade (dictionary), Datum som timestamp (mikrosekunder, utan
+# tidszon, så att klockslaget följer med) och Antal/Belopp som float64. Filen
+# kan läsas direkt av t ex pandas, polars eller DuckDB. Filer med Datum som
+# date32 går också att läsa. Tomma värden godtas bara i Var.
+#
+# Filnamn som slutar på .parquet skrivs som Parquet, .arrow och .feather som
+# Arrow IPC. Arrow-filer läses minnesmappade utan kopiering av kolumnerna.
+#
+# Exempel:
+#   huvudbok.skriv("transaktioner.parquet", translist)
+#   for datum, var, händelse, antal, valuta, belopp in huvudbok.läs("transaktioner.parquet"):
+#       ...
+#
+# Kräver pyarrow.
+
+import sys, datetime
+
+KOLUMNER = ("Datum", "Var", "Händelse", "Antal", "Valuta", "Belopp")
+OBLIGATORISKA = ("Datum", "Händelse", "Antal", "Valuta", "Belopp")
+PARQUET = (".parquet",)
+ARROW = (".arrow", ".feather")
+
+def är_huvudbok(filnamn):
+    return bool(filnamn) and filnamn.lower().endswith(PARQUET + ARROW)
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        sys.exit("Error: Parquet och Arrow kräver att pyarrow är installerat")
+    return pyarrow
+
+def schema():
+    pa = _pyarrow()
+    ordlista = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([("Datum", pa.timestamp("us")), ("Var", ordlista), ("Händelse", ordlista),
+                      ("Antal", pa.float64()), ("Valuta", ordlista), ("Belopp", pa.float64())])
+
+def tabell(translist):
+    """pyarrow.Table med transaktionerna (objekt med datum, var, händelse,
+    antal, valuta och belopp)"""
+    pa = _pyarrow()
+    # Lika datum är oftast samma objekt, omvandla varje datum en gång
+    dagar = {}
+    datum = []
+    for tx in translist:
+        d = tx.datum
+        if d not in dagar:
+            dagar[d] = _tidpunkt(d)
+        datum.append(dagar[d])
+    s = schema()
+    kolumner = [pa.array(datum, type=s.field("Datum").type)]
+    for namn in KOLUMNER[1:]:
+        värden = [getattr(tx, namn.lower()) for tx in translist]
+        typ = s.field(namn).type
+        if pa.types.is_dictionary(typ):
+            kolumner.append(pa.array(värden, type=pa.string()).dictionary_encode())
+        else:
+            kolumner.append(pa.array(värden, type=typ))
+    return pa.Table.from_arrays(kolumner, schema=s)
+
+def skriv(filnamn, translist):
+    """Skriv transaktionerna till filnamn (.parquet, .arrow eller .feather)"""
+    pa = _pyarrow()
+    t = tabell(translist)
+    if filnamn.lower().endswith(PARQUET):
+        import pyarrow.parquet as pq
+        pq.write_table(t, filnamn)
+    else:
+        with pa.OSFile(filnamn, "wb") as f, pa.ipc.new_file(f, t.schema) as w:
+            w.write_table(t)
+    print("Skrivit", filnamn + ":", len(translist), "transaktioner")
+
+def läs_tabell(filnamn):
+    """Filen som pyarrow.Table, Arrow IPC minnesmappad"""
+    pa = _pyarrow()
+    if filnamn.lower().endswith(PARQUET):
+        import pyarrow.parquet as pq
+        t = pq.read_table(filnamn, columns=list(KOLUMNER), memory_map=True)
+    else:
+        t = pa.ipc.open_file(pa.memory_map(filnamn)).read_all()
+    saknas = [k for k in KOLUMNER if k not in t.column_names]
+    if saknas:
+        sys.exit("Error: kolumner saknas i " + filnamn + ": " + ", ".join(saknas))
+    import pyarrow.compute as pc
+    for k in OBLIGATORISKA:
+        kolumn = t.column(k)
+        if kolumn.null_count:
+            rad = pc.index(pc.is_null(kolumn), True).as_py()
+            sys.exit("Error: tomt värde i kolumnen " + k + " på rad " + str(rad + 1)
+                     + " i " + filnamn)
+    return t.select(list(KOLUMNER))
+
+def _ordlista(kolumn, omvandla):
+    """Kolumnens värden som lista. Varje unikt värde omvandlas en gång med
+    omvandla och alla rader med samma värde delar objektet."""
+    pa = _pyarrow()
+    import pyarrow.compute as pc
+    if not pa.types.is_dictionary(kolumn.type):
+        kolumn = kolumn.dictionary_encode()
+    värden = []
+    memo = {}   # delas mellan bitarna, som har var sin ordlista
+    for bit in kolumn.chunks:
+        unika = [None if v is None else memo[v] if v in memo else memo.setdefault(v, omvandla(v))
+                 for v in bit.dictionary.to_pylist()]
+        index = bit.indices
+        if bit.null_count:
+            unika.append(None)
+            index = pc.fill_null(index, len(unika) - 1)
+        värden.extend(map(unika.__getitem__, index.to_pylist()))
+    return värden
+
+def _tidpunkt(d):
+    """datetime som den är, date som datetime vid midnatt"""
+    if isinstance(d, datetime.datetime):
+        return d
+    return datetime.datetime(d.year, d.month, d.day)
+
+def läs(filnamn):
+    """Iterator över transaktionerna i filnamn som tupler (datum, var,
+    händelse, antal, valuta, belopp), med datum som datetime och internade
+    strängar"""
+    t = läs_tabell(filnamn)
+    return zip(_ordlista(t.column("Datum"), _tidpunkt),
+               _ordlista(t.column("Var"), sys.intern),
+               _ordlista(t.column("Händelse"), sys.intern),
+               t.column("Antal").to_pylist(),
+               _ordlista(t.column("Valuta"), sys.intern),
+               t.column("Belopp").to_pylist())
@@ -5,9 +5,12 @@
 # Räkna ut vinst, förlust och utgående genomsnittligt omkostnadsbelopp
 # 
 
-import sys, datetime
-from collections import OrderedDict
+import sys, os, gc, re, datetime, calendar, argparse, json, hashlib
+import concurrent.futures
+from collections import OrderedDict, Counter
+from operator import attrgetter
 import openpyxl
+import resultatfil, tidtagning, huvudbok
 
 # Inflikar:
 SHEET_TRAN = "Transaktioner"
@@ -21,6 +24,11 @@ DIV = "*" * 60
 
 class Konto:
     """Håller innehav och genomsnittligt omkostnadsbelopp för en kryptovaluta"""
+    __slots__ = ("namn", "enhet", "innehav", "gob", "_totbelopp",
+                 "_dekl_vinst_sälj", "_dekl_vinst_sälj_belopp", "_dekl_vinst_omkostnad",
+                 "_dekl_vinst", "_dekl_förlust_sälj", "_dekl_förlust_sälj_belopp",
+                 "_dekl_förlust_omkostnad", "_dekl_förlust", "_dekl_ränta")
+
     def __init__(self, namn, enhet, innehav, gob):
         self.namn = namn
         self.enhet = enhet
@@ -117,6 +125,19 @@ class Konto:
                 self._dekl_förlust_sälj_belopp,
                 self._dekl_förlust_omkostnad,
                 self._dekl_förlust)
+    def har_deklaration(self):
+        return any(self.get_dekl_vinst()) or any(self.get_dekl_förlust())
+
+    def get_state(self):
+        """Kontots hela tillstånd som dict, för kontrollpunkter"""
+        return {namn: getattr(self, namn) for namn in self.__slots__}
+
+    @classmethod
+    def from_state(cls, state):
+        konto = cls.__new__(cls)
+        for namn in cls.__slots__:
+            setattr(konto, namn, state[namn])
+        return konto
 
     def __lt__(self, other):
         """Reverse sort på totalt omkostbelopp, om lika normal sort på namn"""
@@ -130,6 +151,10 @@ class Konto:
 
 class Transaktion:
     """Håller en transaktionsrad, "köp", "sälj" eller "ränta" som händelse"""
+    # Miljontals transaktioner hålls i minnet samtidigt, __slots__ istället
+    # för __dict__ sparar drygt hälften av minnet per objekt
+    __slots__ = ("datum", "var", "händelse", "antal", "valuta", "belopp")
+
     def __init__(self, datum, var, händelse, antal, valuta, belopp):
         self.datum = datum
         self.var = var
@@ -151,55 +176,100 @@ class Transaktion:
             self.datum, self.var, self.händelse,
             self.antal, self.valuta, self.belopp)
 
-class Kalkfil():
-    def __init__(self):
-        errortext = """Användning:
+USAGE = """Användning:
   -  Ange en indata-excelfil som argument (xlsx-fil)
   -  Excelfilen måste ha flikarna "Transaktioner" och "Inbalans"
   -  Utdata skapas i samma excelfil i två nya flikar: "Resultat"
      och "Utbalans".
-        """
-        if len(sys.argv) < 2:
-            sys.exit(errortext)
+  -  Anges en utdata-excelfil som andra argument skrivs flikarna dit
+     istället. Indatafilen läses då enbart och strömmande, vilket kräver
+     mycket mindre minne för stora filer.
+  -  Slutar utdatafilen på .csv (eller .csv.gz) eller .json skrivs
+     resultatet i det formatet istället för som excelflikar.
+  -  Med --transaktioner läses transaktionerna från en Parquet- eller
+     Arrow-fil istället för fliken "Transaktioner", och med
+     --spara-transaktioner skrivs de inlästa transaktionerna till en
+     sådan fil (kräver pyarrow).
+"""
 
-        print("Läser och modifierar", sys.argv[1])
+# Sant om utdatafilen är indatafilen, även via en annan sökväg eller länk
+def samma_fil(filnamn, utfilnamn):
+    try:
+        return os.path.samefile(filnamn, utfilnamn)
+    except OSError:
+        return False
+
+class Kalkfil():
+    """Arbetsboken. Med transaktioner=False behövs ingen flik Transaktioner
+    (sheetT blir None om den saknas). Är utfilename samma fil som filename
+    modifieras arbetsboken som utan utfilename."""
+    def __init__(self, filename, utfilename=None, transaktioner=True):
+        if utfilename and samma_fil(filename, utfilename):
+            utfilename = None
+        self.filename = filename
+        self.utfilename = utfilename
+        if self.utfilename:
+            print("Läser", self.filename, "och skriver", self.utfilename)
+        else:
+            print("Läser och modifierar", self.filename)
         print(DIV)
         try:
-            self.filename = sys.argv[1]
-            workbook = openpyxl.load_workbook(filename = self.filename)
+            # Med separat utdatafil räcker det att läsa indata strömmande
+            workbook = openpyxl.load_workbook(filename = self.filename,
+                                              read_only = self.utfilename is not None)
             print("Befintliga flikar:")
             for s in workbook.sheetnames:
                 print("  ", s)
-            sheet_tran = workbook[SHEET_TRAN]
+            if transaktioner or SHEET_TRAN in workbook:
+                sheet_tran = workbook[SHEET_TRAN]
+            else:
+                sheet_tran = None
             sheet_inbal = workbook[SHEET_INBAL]
         except FileNotFoundError:
             sys.exit("Error: File not found!")
         except KeyError:
             sys.exit("Error: Hittar ej rätt flikar!")
 
-        print("Skriver resultat till flikarna:")
-        print("  ", SHEET_RESULTAT, "(OBS, finns redan)" if SHEET_RESULTAT in workbook else "")
-        print("  ", SHEET_UTBAL, "(OBS, finns redan)" if SHEET_UTBAL in workbook else "")
-        print(DIV)
-        if SHEET_RESULTAT in workbook or SHEET_UTBAL in workbook:
-            print("Varning, någon av utflikarna finns redan och kommer att ersättas.")
-            i = input("Fortsätta? (j/n) ")
-            if not i in 'jJyY':
-                sys.exit("Avbryter!")
+        if self.utfilename and utformat(self.utfilename) != "xlsx":
+            # Resultatet skrivs som csv/json av main(), ingen utarbetsbok
+            self.utbok = None
+            sheetR = sheetU = None
+        elif self.utfilename:
+            # Utflikarna skrivs rad för rad utan att hållas i minnet
+            utbok = openpyxl.Workbook(write_only = True)
+            sheetR = utbok.create_sheet(SHEET_RESULTAT)
+            sheetU = utbok.create_sheet(SHEET_UTBAL)
+            self.utbok = utbok
+        else:
+            print("Skriver resultat till flikarna:")
+            print("  ", SHEET_RESULTAT, "(OBS, finns redan)" if SHEET_RESULTAT in workbook else "")
+            print("  ", SHEET_UTBAL, "(OBS, finns redan)" if SHEET_UTBAL in workbook else "")
             print(DIV)
-        if SHEET_RESULTAT in workbook:
-            workbook.remove(workbook[SHEET_RESULTAT])
-        if SHEET_UTBAL in workbook:
-            workbook.remove(workbook[SHEET_UTBAL])
-        sheetR = workbook.create_sheet(SHEET_RESULTAT)
-        sheetU = workbook.create_sheet(SHEET_UTBAL)
+            if SHEET_RESULTAT in workbook or SHEET_UTBAL in workbook:
+                print("Varning, någon av utflikarna finns redan och kommer att ersättas.")
+                i = input("Fortsätta? (j/n) ")
+                if not i in 'jJyY':
+                    sys.exit("Avbryter!")
+                print(DIV)
+            if SHEET_RESULTAT in workbook:
+                workbook.remove(workbook[SHEET_RESULTAT])
+            if SHEET_UTBAL in workbook:
+                workbook.remove(workbook[SHEET_UTBAL])
+            sheetR = workbook.create_sheet(SHEET_RESULTAT)
+            sheetU = workbook.create_sheet(SHEET_UTBAL)
+            self.utbok = workbook
 
         self.sheetT, self.sheetI = sheet_tran, sheet_inbal
         self.sheetR, self.sheetU = sheetR, sheetU
         self.workbook = workbook
 
     def save(self):
-        self.workbook.save(self.filename)
+        if self.utfilename:
+            if self.utbok:
+                self.utbok.save(self.utfilename)
+            self.workbook.close()
+        else:
+            self.workbook.save(self.filename)
     
 # Läser in fliken "Inbalans"
 #
@@ -247,54 +317,168 @@ def read_inbalans(sheet):
 #     Transaktion("2019-01-11 00:00:00","bittrex","köp","30.0","REP","2611.0") ]
 
 def read_transactions(sheet):
+    return read_transaction_rows(sheet.iter_rows(values_only = True))
+
+# Läser transaktionerna från en huvudbok (Parquet eller Arrow, se huvudbok.py).
+# Samma omvandling till mBTC/mETH och kontroll av belopp som för fliken, för
+# filer som skrivits av andra program. Tomma värden avvisas redan av
+# huvudbok.läs().
+#
+# Skräpsamlaren stängs av medan objekten skapas. Inget av dem kan ingå i en
+# cykel, och annars går mer än halva inläsningstiden åt till att gå igenom
+# de redan skapade transaktionerna gång på gång.
+
+def read_ledger(filnamn):
     translist = []
-    foundtable = False
-    for row in sheet.iter_rows(values_only = True):
-        if foundtable:
-            try:
-                datum = row[col_datum]
-                var = row[col_var]
-                händelse = row[col_händelse]
-                antal = float(row[col_antal])
-                valuta = row[col_valuta]
-                belopp = float(row[col_belopp])
-#                print(datum, var, händelse, antal, valuta, belopp)
-                # Om datum och var är tomma, kopiera från föregående rad
-                if not datum or str(datum).strip() == "":
-                    datum = old_datum
-                if not var or var.strip() == "":
-                    var = old_var
-                if type(datum) == str:
-                    datum = datetime.datetime.strptime(datum, "%Y-%m-%d")
-#                print(datum, var, händelse, antal, valuta, belopp)
-                old_datum = datum
-                old_var = var
-                # Omvandling enheter, gillar milli BTC/ETH bättre
-                if valuta == "BTC":
-                    valuta = "mBTC"
-                    antal *= 1000
-                if valuta == "ETH":
-                    valuta = "mETH"
-                    antal *= 1000
-                if belopp < 0:
-                    sys.exit("Error: belopp negativt eller 0, " + str(row[0:5]))
-                trans = Transaktion(datum, var, händelse, antal, valuta, belopp)
-                translist.append(trans)
-            except (TypeError, ValueError):
-                pass
+    på = gc.isenabled()
+    gc.disable()
+    try:
+        for datum, var, händelse, antal, valuta, belopp in huvudbok.läs(filnamn):
+            if valuta == "BTC" or valuta == "ETH":
+                valuta = sys.intern("m" + valuta)
+                antal *= 1000
+            if belopp < 0:
+                sys.exit("Error: belopp negativt eller 0, " + str([datum, var, händelse, antal, valuta]))
+            translist.append(Transaktion(datum, var, händelse, antal, valuta, belopp))
+    finally:
+        if på:
+            gc.enable()
+    print("Läst Transaktioner:", len(translist), "rader från", filnamn)
+    return translist
+
+# Samma som read_transactions men för godtyckliga rader (tupler), t ex
+# resultatet från en process i minnet (resultatfil.Resultatfil(None).rader)
+#
+# Raderna före rubrikraden (med Datum, Var, Händelse, Antal, Valuta och
+# Belopp) hoppas över. Därefter klassas varje rad utan undantag: rader utan
+# tal i Antal eller Belopp, eller med ett datum som inte är ÅÅÅÅ-MM-DD, räknas
+# per orsak och skrivs ut som statistik. Skicka in en dict som statistik för
+# att få antalen.
+#
+# Var, händelse och valuta internas och lika datum delas, så att alla
+# transaktioner refererar till samma få sträng- och datumobjekt. Det sparar
+# minne och gör jämförelserna i Konto.update till identitetsjämförelser.
+
+RUBRIKER = ("Datum", "Var", "Händelse", "Antal", "Valuta", "Belopp")
+TAL = re.compile(r"\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$")
+ISODATUM = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})$")
+
+def intern(värde):
+    return sys.intern(värde) if type(värde) is str else värde
+
+def tal(värde):
+    """Värdet som float om det är ett tal eller en sträng med ett tal, annars None"""
+    t = type(värde)
+    if t is float:
+        return värde
+    if t is int:
+        return float(värde)
+    if t is str and TAL.match(värde):
+        return float(värde)
+    return None
+
+def iso_datum(text):
+    """datetime för "ÅÅÅÅ-MM-DD", None om texten inte är ett giltigt datum"""
+    m = ISODATUM.match(text)
+    if not m:
+        return None
+    år, månad, dag = int(m[1]), int(m[2]), int(m[3])
+    if not (1 <= år and 1 <= månad <= 12 and 1 <= dag <= calendar.monthrange(år, månad)[1]):
+        return None
+    return datetime.datetime(år, månad, dag)
+
+def read_transaction_rows(rows, statistik=None):
+    translist = []
+    datumobjekt = {}    # datum och datumtext -> delat datetime-objekt (None om ogiltigt)
+    strängar = {}       # var, händelse, valuta -> internad sträng
+    överhoppade = Counter()
+    rows = iter(rows)
+    # Leta upp rubrikraden
+    for row in rows:
+        if "Datum" in row and all(r in row for r in RUBRIKER):
+            kolumner = [row.index(r) for r in RUBRIKER]
+            break
+    else:
+        kolumner = None
+    if kolumner:
+        col_datum, col_var, col_händelse, col_antal, col_valuta, col_belopp = kolumner
+        radlängd = max(kolumner) + 1
+    else:
+        rows = ()
+    old_datum = old_var = None
+    for row in rows:
+        if len(row) < radlängd:
+            överhoppade["för kort"] += 1
+            continue
+        antal = row[col_antal]
+        if type(antal) is not float:
+            antal = tal(antal)
+        belopp = row[col_belopp]
+        if type(belopp) is not float:
+            belopp = tal(belopp)
+        if antal is None or belopp is None:
+            if not any(v is not None and v != "" for v in row):
+                överhoppade["tom"] += 1
+            elif antal is None:
+                överhoppade["antal ej tal"] += 1
+            else:
+                överhoppade["belopp ej tal"] += 1
+            continue
+        datum = row[col_datum]
+        var = row[col_var]
+        # Om datum och var är tomma, kopiera från föregående rad
+        if not datum or (type(datum) is str and datum.strip() == ""):
+            datum = old_datum
+            if datum is None:
+                överhoppade["datum saknas"] += 1
+                continue
+        elif datum in datumobjekt:
+            datum = datumobjekt[datum]
+            if datum is None:
+                överhoppade["ogiltigt datum"] += 1
+                continue
         else:
-            try:
-                col_datum = row.index("Datum")
-                col_var = row.index("Var")
-                col_händelse = row.index("Händelse")
-                col_antal = row.index("Antal")
-                col_valuta = row.index("Valuta")
-                col_belopp = row.index("Belopp")
-#                print("Hittade transaktionstabellen")
-                foundtable = True
-            except ValueError:
-                pass
+            objekt = iso_datum(datum) if type(datum) is str else datum
+            if objekt is not None:
+                objekt = datumobjekt.setdefault(objekt, objekt)
+            datumobjekt[datum] = objekt
+            if objekt is None:
+                överhoppade["ogiltigt datum"] += 1
+                continue
+            datum = objekt
+        if not var or (type(var) is str and var.strip() == ""):
+            var = old_var
+        if var in strängar:
+            var = strängar[var]
+        else:
+            var = strängar[var] = intern(var)
+        old_datum = datum
+        old_var = var
+        valuta = row[col_valuta]
+        händelse = row[col_händelse]
+        if händelse in strängar:
+            händelse = strängar[händelse]
+        else:
+            händelse = strängar[händelse] = intern(händelse)
+        # Omvandling enheter, gillar milli BTC/ETH bättre
+        if valuta == "BTC":
+            valuta = "mBTC"
+            antal *= 1000
+        elif valuta == "ETH":
+            valuta = "mETH"
+            antal *= 1000
+        if belopp < 0:
+            sys.exit("Error: belopp negativt eller 0, " + str(row[0:5]))
+        if valuta in strängar:
+            valuta = strängar[valuta]
+        else:
+            valuta = strängar[valuta] = intern(valuta)
+        translist.append(Transaktion(datum, var, händelse, antal, valuta, belopp))
     print("Läst Transaktioner:", len(translist), "rader")
+    if överhoppade:
+        print("Överhoppade rader:", ", ".join("%s %d" % (orsak, n) for orsak, n in sorted(överhoppade.items())))
+    if statistik is not None:
+        statistik.update(överhoppade)
     return translist
 
 # Sprid ut transaktionsraderna sorterade på valutan i en dict.
@@ -310,150 +494,335 @@ def sort_check_transactions(balans, translist):
     for tx in translist:
         transtable.setdefault(tx.valuta, []).append(tx)
     for valuta in transtable.keys():
-        transtable[valuta].sort()
+        # Samma ordning som Transaktion.__lt__ men utan ett metodanrop per jämförelse
+        transtable[valuta].sort(key=attrgetter("datum"))
     diff = transtable.keys() - balans.keys()   # set difference
     if len(diff) > 0:
         sys.exit("Error, några valutor saknas i inbalansen:\n" + str(diff))
     return transtable
 
+# Kör alla transaktioner för en valuta genom kontot.
+#
+# Returnerar en rad per transaktion med (omkostnad, vinst, ränta, innehav, gob)
+# efter transaktionen.
+
+def compute_konto(konto, txs):
+    rader = []
+    for tx in txs:
+        omkostnad, vinst, ränta = konto.update(tx.datum, tx.händelse, tx.antal, tx.belopp)
+        rader.append((omkostnad, vinst, ränta, konto.innehav, konto.gob))
+    return rader
+
+# Räkna alla valutor parallellt i en processpool.
+#
+# Valutorna är oberoende av varandra, så varje valutas konto och transaktioner
+# skickas till en egen process. Kontot kommer tillbaka uppdaterat tillsammans
+# med raderna från compute. balans ändras inte här, beräkna() byter ut
+# kontona när resultatet skrivs. Största valutorna startas först så att de
+# inte blir liggande sist.
+
+def compute_valuta(compute, konto, txs):
+    return konto, compute(konto, txs)
+
+def compute_parallel(balans, transtable, compute=compute_konto, processer=None):
+    valutor = [v for v in balans.keys() if v in transtable]
+    valutor.sort(key=lambda v: len(transtable[v]), reverse=True)
+    with concurrent.futures.ProcessPoolExecutor(processer) as pool:
+        jobb = {v: pool.submit(compute_valuta, compute, balans[v], transtable[v])
+                for v in valutor}
+        return {v: j.result() for v, j in jobb.items()}
+
+# Resultatet av beräkningen, utan något om hur det ska skrivas ut.
+#
+# beräkna() kör alla valutor genom sina konton och returnerar ett Resultat.
+# Renderarna nedan (output_results, output_csv, output_json) läser bara
+# därifrån, så beräkningen kan också köras utan att någon utfil skapas:
+#
+#   balans = read_inbalans(...)
+#   transtable = sort_check_transactions(balans, read_transaction_rows(rader))
+#   resultat = beräkna(balans, transtable)
+#   print(resultat.tot_vinst, resultat.skatt)
+
+class Valutaresultat:
+    """Resultatet för en valuta: ingående innehav och GOB, transaktionerna
+    med (omkostnad, vinst, ränta, innehav, gob) per rad och kontot efteråt"""
+    def __init__(self, valuta, innehav, gob, txs, rader, konto):
+        self.valuta = valuta
+        self.innehav = innehav
+        self.gob = gob
+        self.txs = txs
+        self.rader = rader
+        self.konto = konto
+
+    def get_dekl_vinst(self):
+        return self.konto.get_dekl_vinst()
+
+    def get_dekl_förlust(self):
+        return self.konto.get_dekl_förlust()
+
+class Resultat:
+    """Hela beräkningen: valutorna i inbalansens ordning, totalerna och
+    utgående balans (balans, uppdaterad med alla transaktioner)"""
+    def __init__(self, balans, totalt=(0, 0, 0)):
+        self.balans = balans
+        self.valutor = []
+        self.tot_vinst, self.tot_förlust, self.tot_ränta = totalt
+
+    @property
+    def skatt(self):
+        return (self.tot_vinst + self.tot_ränta + self.tot_förlust*0.7)*0.3
+
+    def add(self, vr):
+        self.valutor.append(vr)
+        for omkostnad, vinst, ränta, innehav, gob in vr.rader:
+            if vinst != None:
+                if vinst >= 0:
+                    self.tot_vinst += vinst
+                else:
+                    self.tot_förlust += vinst
+            if ränta != None:
+                self.tot_ränta += ränta
+
+# Uppdaterar alla konton i "balans"-dicten med compute. Med processer > 1
+# räknas valutorna först parallellt (compute_parallel), totalerna summeras
+# ändå i inbalansens ordning. totalt är startvärdet för totalerna, t ex från
+# en kontrollpunkt. Med kontrollpunkt=True tas även valutor utan
+# transaktioner med om kontot redan har deklarationssummor.
+
+def beräkna(balans, transtable, compute=compute_konto, processer=1, totalt=(0, 0, 0),
+            kontrollpunkt=False):
+    resultat = Resultat(balans, totalt)
+    beräknat = None
+    if processer != 1:
+        beräknat = compute_parallel(balans, transtable, compute, processer or None)
+    # Utgå från valutorna i inbalansen för att få samma sorteringsordning
+    # Dessa är ett superset av tx-valutorna
+    for valuta in list(balans.keys()):
+        if not valuta in transtable.keys():
+            # Alla inbalansvalutor finns kanske inte som transaktioner, men
+            # deklarationssummorna från en kontrollpunkt ska ändå med
+            konto = balans[valuta]
+            if kontrollpunkt and konto.har_deklaration():
+                resultat.add(Valutaresultat(valuta, konto.innehav, konto.gob, [], [], konto))
+            continue
+        konto = balans[valuta]
+        innehav, gob = konto.innehav, konto.gob
+        txs = transtable[valuta]
+        if beräknat is not None:
+            konto, rader = beräknat.pop(valuta)
+            balans[valuta] = konto
+        else:
+            rader = compute(konto, txs)
+        resultat.add(Valutaresultat(valuta, innehav, gob, txs, rader, konto))
+    return resultat
+
+def print_totals(resultat):
+    print("Total vinst:  ", resultat.tot_vinst)
+    print("Total förlust:", resultat.tot_förlust)
+    print("Total ränta:  ", resultat.tot_ränta)
+    print("Total skatt:  ", resultat.skatt)
+
+# Kontrollpunkter
+#
+# En kontrollpunkt sparar alla kontons tillstånd (innehav, gob, _totbelopp och
+# deklarationssummorna) och totalerna efter alla transaktioner till och med ett
+# datum, tillsammans med en hash av inbalansen och en hash av transaktionerna
+# till och med datumet. Nästa körning med samma kontrollpunktsfil räknar bara
+# transaktionerna efter datumet, om inbalansen och de tidigare transaktionerna
+# är oförändrade. Annars räknas allt om från inbalansen.
+#
+# Resultatfliken visar då bara de nya transaktionerna, med kontrollpunktens
+# innehav och GOB som ingående värden. Deklarationssummor och totaler gäller
+# hela perioden, som vid en full omräkning (totalerna kan skilja sig på sista
+# decimalen eftersom de summeras i en annan ordning). Valutor som har
+# deklarationssummor från kontrollpunkten men inga nya transaktioner visas
+# också, utan rader.
+
+KONTROLLPUNKT_VERSION = 1
+
+def hash_inbalans(balans):
+    h = hashlib.sha256()
+    for konto in balans.values():
+        h.update(repr(konto.getAll()).encode("utf-8"))
+    return h.hexdigest()
+
+def hash_transactions(translist):
+    """Hash av transaktionerna i filordning"""
+    h = hashlib.sha256()
+    for tx in translist:
+        h.update(repr(tx.getAll()).encode("utf-8"))
+    return h.hexdigest()
+
+def load_checkpoint(filnamn):
+    """Läs en kontrollpunkt, None om filen inte finns"""
+    try:
+        with open(filnamn, encoding="utf-8") as f:
+            kp = json.load(f)
+    except FileNotFoundError:
+        return None
+    if kp.get("version") != KONTROLLPUNKT_VERSION:
+        print("Kontrollpunkten", filnamn, "har fel version, används inte")
+        return None
+    return kp
+
+def apply_checkpoint(kp, balans, translist):
+    """Om kontrollpunkten gäller för balans och translist: byt ut kontona i
+    balans mot kontrollpunktens och returnera (transaktioner efter
+    kontrollpunkten, totaler). Annars None och inget ändras."""
+    if kp["inbalans"] != hash_inbalans(balans):
+        print("Inbalansen har ändrats sedan kontrollpunkten, räknar om allt")
+        return None
+    datum = datetime.datetime.fromisoformat(kp["datum"])
+    tidigare = [tx for tx in translist if tx.datum <= datum]
+    if len(tidigare) != kp["antal"] or hash_transactions(tidigare) != kp["transaktioner"]:
+        print("Transaktioner till och med", kp["datum"], "har ändrats sedan kontrollpunkten, räknar om allt")
+        return None
+    for enhet, state in kp["konton"].items():
+        balans[enhet] = Konto.from_state(state)
+    nya = [tx for tx in translist if tx.datum > datum]
+    print("Använder kontrollpunkt till och med", kp["datum"] + ",", len(nya), "nya transaktioner")
+    t = kp["totalt"]
+    return nya, (t["vinst"], t["förlust"], t["ränta"])
+
+def save_checkpoint(filnamn, inbalans_hash, translist, resultat):
+    """Spara kontrollpunkt efter alla transaktioner i translist"""
+    if not translist:
+        return
+    datum = max(tx.datum for tx in translist)
+    kp = {
+        "version": KONTROLLPUNKT_VERSION,
+        "datum": datum.isoformat(),
+        "inbalans": inbalans_hash,
+        "antal": len(translist),
+        "transaktioner": hash_transactions(translist),
+        "konton": {enhet: konto.get_state() for enhet, konto in resultat.balans.items()},
+        "totalt": {"vinst": resultat.tot_vinst, "förlust": resultat.tot_förlust,
+                   "ränta": resultat.tot_ränta},
+    }
+    # Skriv till en temporär fil först så att en avbruten körning inte
+    # lämnar en trasig kontrollpunkt efter sig
+    tmp = filnamn + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(kp, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, filnamn)
+    print("Sparat kontrollpunkt till och med", kp["datum"], "i", filnamn)
+
 # Skriv ut resultatfliken "Resultat"
 #
 # Skapar många små tabeller för var sin valuta med
 # extra kolumner för vinst, förlust och ränteberäkningarna.
 #
-# Uppdaterar löpande alla konton i "balans"-dicten.
+# Varje rad byggs som en lista och läggs till med sheet.append(), så att
+# samma kod fungerar för vanliga flikar och för write_only-arbetsböcker.
 
 ROWHEIGHT = 12.8 # verkar lagom stort
 
-def output_results(sheet, balans, transtable):
+# Gemensamma cellstilar för utflikarna, registreras en gång per arbetsbok
+STIL_FET = "Fet"
+STIL_FET_HÖGER = "Fet högerställd"
+STIL_FET_TAL = "Fet tal"
+STIL_DATUM = "Datum"
+
+def add_styles(workbook):
     boldfont = openpyxl.styles.Font(name='Arial',size=10,bold=True)
-    sheet["A1"].value = "Resultat"
-    sheet["A1"].font = boldfont
-    for i in range(3):
-        sheet.row_dimensions[i+1].height = ROWHEIGHT
-    row = 4
-    # Utgå från valutorna i inbalansen för att få samma sorteringsordning
-    # Dessa är ett superset av tx-valutorna
-    valutor = balans.keys()
+    stilar = [
+        openpyxl.styles.NamedStyle(name=STIL_FET, font=boldfont),
+        openpyxl.styles.NamedStyle(name=STIL_FET_HÖGER, font=boldfont,
+            alignment=openpyxl.styles.Alignment(horizontal="right")),
+        openpyxl.styles.NamedStyle(name=STIL_FET_TAL, font=boldfont, number_format="0.00"),
+        openpyxl.styles.NamedStyle(name=STIL_DATUM, number_format='YYYY-MM-DD',
+            alignment=openpyxl.styles.Alignment(horizontal="left")),
+    ]
+    for stil in stilar:
+        if stil.name not in workbook.named_styles:
+            workbook.add_named_style(stil)
+
+def styled(sheet, value, style):
+    """Cell med en av de gemensamma stilarna, för sheet.append()"""
+    cell = openpyxl.cell.WriteOnlyCell(sheet, value)
+    cell.style = style
+    return cell
+
+def set_row_height(sheet):
+    """Samma radhöjd på alla rader, sätts en gång för hela fliken"""
+    sheet.sheet_format.defaultRowHeight = ROWHEIGHT
+    sheet.sheet_format.customHeight = True
+
+def output_results(sheet, resultat):
+    add_styles(sheet.parent)
+    set_row_height(sheet)
+    # Set fairly sensible column widths. Width is expressed as the
+    # number of monospace characters. Will do even for other fonts.
+    # Måste sättas innan raderna skrivs i write_only-läge.
+    sheet.column_dimensions["A"].width = 14
+    sheet.column_dimensions["B"].width = 11
+    sheet.column_dimensions["C"].width = 20
+    sheet.column_dimensions["G"].width = 14
+    for c in "HIMNOP":
+        sheet.column_dimensions[c].width = 11
+        sheet.column_dimensions[c].number_format = "0.00"
+
+    sheet.append([styled(sheet, "Resultat", STIL_FET)])
+    sheet.append([])
+    sheet.append([])
     h = ["Datum","Var","Händelse","Antal+","Antal-","Valuta",
          "Belopp+", "Belopp-", None,
          "Innehav", "GOB", "Omkostnad", "Vinst", "Förlust", "Ränta"]
-    tot_vinst = 0
-    tot_förlust = 0
-    tot_ränta = 0
-    for valuta in valutor:
-        if not valuta in transtable.keys():
-            # Alla inbalansvalutor finns kanske inte som transaktioner
-            continue
+    for vr in resultat.valutor:
+        valuta = vr.valuta
         newh = [valuta] + h
-        for c,v in enumerate(newh):
-            cell = sheet.cell(row=row, column=c+1)
-            cell.value = v
-            cell.font = boldfont
-            if v not in [valuta, "Datum", "Var", "Händelse", "Valuta"]:
-                cell.alignment = openpyxl.styles.Alignment(horizontal="right")
-        sheet.row_dimensions[row].height = ROWHEIGHT
-        row += 1
-        try:
-            konto = balans[valuta]
-        except KeyError:
-            sys.exit("Error: " + valuta + " finns inte i inbalans")
-        sheet.cell(row=row, column=11).value = konto.innehav
-        sheet.cell(row=row, column=12).value = konto.gob
-        sheet.row_dimensions[row].height = ROWHEIGHT
-        row += 1
-        dekl_sälj = 0
-        dekl_sälj_belopp = 0;
-        for tx in transtable[valuta]:
+        sheet.append([styled(sheet, v, STIL_FET if v in [valuta, "Datum", "Var", "Händelse", "Valuta"]
+                             else STIL_FET_HÖGER) for v in newh])
+        sheet.append([None] * 10 + [vr.innehav, vr.gob])
+        for tx, (omkostnad, vinst, ränta, innehav, gob) in zip(vr.txs, vr.rader):
             v = tx.getAll()
-            sheet.cell(row=row, column=2).value = v[0] # Datum
-            sheet.cell(row=row, column=2).alignment = openpyxl.styles.Alignment(horizontal="left")
-            sheet.cell(row=row, column=3).value = v[1] # Var
-            sheet.cell(row=row, column=4).value = v[2] # Händelse
+            r = [None] * 16
+            r[1] = styled(sheet, v[0], STIL_DATUM) # Datum
+            r[2] = v[1] # Var
+            r[3] = v[2] # Händelse
             if v[3] > 0:
-                sheet.cell(row=row, column=5).value = v[3] # Debet+
-                sheet.cell(row=row, column=8).value = v[5] # Belopp+
+                r[4] = v[3] # Debet+
+                r[7] = v[5] # Belopp+
             else:
-                sheet.cell(row=row, column=6).value = v[3] # Kredit-
-                sheet.cell(row=row, column=9).value = v[5] # Belopp-
-                dekl_sälj += v[3]
-                dekl_sälj_belopp += v[5]
-            sheet.cell(row=row, column=7).value = v[4] # Valuta
-            sheet.cell(row=row, column=2).number_format = 'YYYY-MM-DD'
-            omkostnad, vinst, ränta = konto.update(tx.datum, tx.händelse, tx.antal, tx.belopp)
-            sheet.cell(row=row, column=11).value = konto.innehav
-            sheet.cell(row=row, column=12).value = konto.gob
+                r[5] = v[3] # Kredit-
+                r[8] = v[5] # Belopp-
+            r[6] = v[4] # Valuta
+            r[10] = innehav
+            r[11] = gob
             if vinst != None:
-                sheet.cell(row=row, column=13).value = omkostnad
-                if vinst >= 0:
-                    col = 14
-                    tot_vinst += vinst
-                else:
-                    col = 15
-                    tot_förlust += vinst
-                sheet.cell(row=row, column=col).value = vinst
+                r[12] = omkostnad
+                r[13 if vinst >= 0 else 14] = vinst
             if ränta != None:
-                sheet.cell(row=row, column=16).value = ränta
-                tot_ränta += ränta
-            sheet.row_dimensions[row].height = ROWHEIGHT
-            row += 1
-        dsälj, dbelopp, domkostnad, dvinst = konto.get_dekl_vinst()
+                r[15] = ränta
+            sheet.append(r)
+        dsälj, dbelopp, domkostnad, dvinst = vr.get_dekl_vinst()
         if dvinst > 0:
-            sheet.cell(row=row, column=3).value = "Deklaration vinst"
-            sheet.cell(row=row, column=6).value = dsälj
-            sheet.cell(row=row, column=9).value = dbelopp
-            sheet.cell(row=row, column=13).value = domkostnad
-            sheet.cell(row=row, column=14).value = dvinst
-            for i in [3, 6, 9, 13, 14]:
-                sheet.cell(row=row, column=i).font = boldfont
-                if i >= 9:
-                    sheet.cell(row=row, column=i).number_format = "0.00"
-            row += 1
-        dsälj, dbelopp, domkostnad, dvinst = konto.get_dekl_förlust()
+            sheet.append([None, None,
+                          styled(sheet, "Deklaration vinst", STIL_FET), None, None,
+                          styled(sheet, dsälj, STIL_FET), None, None,
+                          styled(sheet, dbelopp, STIL_FET_TAL), None, None, None,
+                          styled(sheet, domkostnad, STIL_FET_TAL),
+                          styled(sheet, dvinst, STIL_FET_TAL)])
+        dsälj, dbelopp, domkostnad, dvinst = vr.get_dekl_förlust()
         if dvinst < 0:
-            sheet.cell(row=row, column=3).value = "Deklaration förlust"
-            sheet.cell(row=row, column=6).value = dsälj
-            sheet.cell(row=row, column=9).value = dbelopp
-            sheet.cell(row=row, column=13).value = domkostnad
-            sheet.cell(row=row, column=15).value = dvinst
-            for i in [3, 6, 9, 13, 14, 15]:
-                sheet.cell(row=row, column=i).font = boldfont
-                if i >= 9:
-                    sheet.cell(row=row, column=i).number_format = "0.00"
-            row += 1
-        row += 1
-    row += 1
-    sheet.cell(row=row, column=14).value = "TOTALT"
-    sheet.cell(row=row, column=14).font = boldfont
-    for c in range(3):
-        sheet.cell(row=row+1, column=14+c).value = ["Vinst", "Förlust", "Ränta"][c]
-        sheet.cell(row=row+1, column=14+c).font = boldfont
-        sheet.cell(row=row+2, column=14+c).value = [tot_vinst, tot_förlust, tot_ränta][c]
-    for i in range(3):
-        sheet.row_dimensions[row+i].height = ROWHEIGHT
-        
-    row += 4
-    skatt = (tot_vinst + tot_ränta + tot_förlust*0.7)*0.3
-    sheet.cell(row=row, column=14).value = "SKATT"
-    sheet.cell(row=row, column=14).font = boldfont
-    sheet.cell(row=row+1, column=14).value = skatt
-    
-    # Set fairly sensible column widths. Width is expressed as the
-    # number of monospace characters. Will do even for other fonts.
-    sheet.column_dimensions["A"].width = 14
-    sheet.column_dimensions["B"].width = 11
-    sheet.column_dimensions["C"].width = 20
-    sheet.column_dimensions["G"].width = 14
-    for c in "HIMNOP":
-        sheet.column_dimensions[c].width = 11
-        sheet.column_dimensions[c].number_format = "0.00"
-    
+            sheet.append([None, None,
+                          styled(sheet, "Deklaration förlust", STIL_FET), None, None,
+                          styled(sheet, dsälj, STIL_FET), None, None,
+                          styled(sheet, dbelopp, STIL_FET_TAL), None, None, None,
+                          styled(sheet, domkostnad, STIL_FET_TAL),
+                          styled(sheet, None, STIL_FET_TAL),
+                          styled(sheet, dvinst, STIL_FET_TAL)])
+        sheet.append([])
+    sheet.append([])
+    sheet.append([None] * 13 + [styled(sheet, "TOTALT", STIL_FET)])
+    sheet.append([None] * 13 + [styled(sheet, v, STIL_FET) for v in ["Vinst", "Förlust", "Ränta"]])
+    sheet.append([None] * 13 + [resultat.tot_vinst, resultat.tot_förlust, resultat.tot_ränta])
+    sheet.append([])
+
+    sheet.append([None] * 13 + [styled(sheet, "SKATT", STIL_FET)])
+    sheet.append([None] * 13 + [resultat.skatt])
 
     print("Skapat ny flik", SHEET_RESULTAT)
-    print("Total vinst:  ", tot_vinst)
-    print("Total förlust:", tot_förlust)
-    print("Total ränta:  ", tot_ränta)
-    print("Total skatt:  ", skatt)
 
 # Skriv ut utbalansfliken. Måste köras sist då balansen är uppdaterad med
 # alla transaktioner.
@@ -462,40 +831,190 @@ def output_utbalans(sheet, balans):
     konton = list(balans.values())
     konton.sort()
 #    print(konton)
-    boldfont = openpyxl.styles.Font(name='Arial',size=10,bold=True)
-    sheet["A1"].value = "Utgående balans"
-    sheet["A1"].font = boldfont
-    for i in range(3):
-        sheet.row_dimensions[i+1].height = ROWHEIGHT
-    h = ["Namn","Enhet","Innehav","GOB","","Omkostnad"]
-    for c in range(1,len(h)+1):
-        cell = sheet.cell(row=3, column=c)
-        cell.value = h[c-1]
-        cell.font = boldfont
-    row = 4
-    for k in konton:
-        for i,v in enumerate(k.getAll()):
-            sheet.cell(row=row, column=i+1).value = v
-        sheet.cell(row=row, column=6).value = k.innehav * k.gob
-        sheet.row_dimensions[row].height = ROWHEIGHT
-        row += 1
+    add_styles(sheet.parent)
+    set_row_height(sheet)
     # Set fairly sensible column widths. Width is expressed as the
     # number of monospace characters. Will do even for other fonts.
     sheet.column_dimensions["A"].width = 20
     sheet.column_dimensions["B"].width = 15
     sheet.column_dimensions["F"].number_format = "0"
+    sheet.append([styled(sheet, "Utgående balans", STIL_FET)])
+    sheet.append([])
+    h = ["Namn","Enhet","Innehav","GOB","","Omkostnad"]
+    sheet.append([styled(sheet, v, STIL_FET) for v in h])
+    for k in konton:
+        sheet.append(k.getAll() + [None, k.innehav * k.gob])
     print("Skapat ny flik", SHEET_UTBAL)
 
+# Skriv resultatet som csv, en rad per transaktion med valutan först.
+# Samma kolumner som i fliken "Resultat", men Antal och Belopp med tecken.
+# Efter varje valutas rader kommer deklarationssummorna ("Deklaration vinst"
+# och "Deklaration förlust" i kolumnen Händelse) som i fliken, och sist två
+# egna tabeller med totalerna och utgående balans som i fliken "Utbalans".
+# Filnamn som slutar på .gz skrivs komprimerade (se resultatfil.py).
+
+def datumtext(datum):
+    if isinstance(datum, (datetime.date, datetime.datetime)):
+        return datum.strftime("%Y-%m-%d")
+    return datum
+
+def output_csv(filnamn, resultat):
+    with resultatfil.öppna(filnamn) as f:
+        f.writerow(("Valuta", "Datum", "Var", "Händelse", "Antal", "Belopp",
+                    "Innehav", "GOB", "Omkostnad", "Vinst", "Förlust", "Ränta"))
+        for vr in resultat.valutor:
+            for tx, (omkostnad, vinst, ränta, innehav, gob) in zip(vr.txs, vr.rader):
+                f.writerow((vr.valuta, datumtext(tx.datum), tx.var, tx.händelse,
+                            tx.antal, tx.belopp, innehav, gob, omkostnad,
+                            vinst if vinst != None and vinst >= 0 else None,
+                            vinst if vinst != None and vinst < 0 else None,
+                            ränta))
+            dsälj, dbelopp, domkostnad, dvinst = vr.get_dekl_vinst()
+            if dvinst > 0:
+                f.writerow((vr.valuta, None, None, "Deklaration vinst", dsälj, dbelopp,
+                            None, None, domkostnad, dvinst, None, None))
+            dsälj, dbelopp, domkostnad, dvinst = vr.get_dekl_förlust()
+            if dvinst < 0:
+                f.writerow((vr.valuta, None, None, "Deklaration förlust", dsälj, dbelopp,
+                            None, None, domkostnad, None, dvinst, None))
+        f.writerow(())
+        f.writerow(("Totalt",))
+        f.writerow(("Vinst", "Förlust", "Ränta", "Skatt"))
+        f.writerow((resultat.tot_vinst, resultat.tot_förlust, resultat.tot_ränta, resultat.skatt))
+        f.writerow(())
+        f.writerow(("Utgående balans",))
+        f.writerow(("Namn", "Enhet", "Innehav", "GOB", "Omkostnad"))
+        for k in sorted(resultat.balans.values()):
+            f.writerow((k.namn, k.enhet, k.innehav, k.gob, k.innehav * k.gob))
+    print("Skrivit", filnamn)
+
+# Skriv hela resultatet som json: transaktionsraderna och deklarationssummorna
+# per valuta, totalerna och utgående balans. Raderna skrivs som listor med
+# kolumnnamnen en gång i "kolumner" för att hålla nere storleken.
+
+def output_json(filnamn, resultat):
+    kolumner = ["Datum", "Var", "Händelse", "Antal", "Belopp",
+                "Innehav", "GOB", "Omkostnad", "Vinst", "Ränta"]
+    valutor = OrderedDict()
+    for vr in resultat.valutor:
+        valutor[vr.valuta] = {
+            "ingående": {"innehav": vr.innehav, "gob": vr.gob},
+            "rader": [[datumtext(tx.datum), tx.var, tx.händelse, tx.antal, tx.belopp,
+                       innehav, gob, omkostnad, vinst, ränta]
+                      for tx, (omkostnad, vinst, ränta, innehav, gob) in zip(vr.txs, vr.rader)],
+            "deklaration vinst": dict(zip(["antal", "belopp", "omkostnad", "vinst"],
+                                          vr.get_dekl_vinst())),
+            "deklaration förlust": dict(zip(["antal", "belopp", "omkostnad", "vinst"],
+                                            vr.get_dekl_förlust())),
+        }
+    konton = sorted(resultat.balans.values())
+    data = {
+        "kolumner": kolumner,
+        "valutor": valutor,
+        "totalt": {"vinst": resultat.tot_vinst, "förlust": resultat.tot_förlust,
+                   "ränta": resultat.tot_ränta, "skatt": resultat.skatt},
+        "utbalans": [{"namn": k.namn, "enhet": k.enhet, "innehav": k.innehav,
+                      "gob": k.gob, "omkostnad": k.innehav * k.gob} for k in konton],
+    }
+    with open(filnamn, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    print("Skrivit", filnamn)
+
+# Utdataformat efter filändelsen på utdatafilen
+def utformat(filnamn):
+    if filnamn and (filnamn.endswith(".csv") or filnamn.endswith(".csv.gz")):
+        return "csv"
+    if filnamn and filnamn.endswith(".json"):
+        return "json"
+    return "xlsx"
+
+# Skriv resultatet i det format som kalkfilens utdatafil anger och spara
+def output_all(kalkfil, resultat):
+    format = utformat(kalkfil.utfilename)
+    rader = sum(len(vr.rader) for vr in resultat.valutor)
+    if format == "xlsx":
+        with tidtagning.fas("output_results") as f:
+            output_results(kalkfil.sheetR, resultat)
+            f.rader = rader
+    print_totals(resultat)
+    if format == "xlsx":
+        with tidtagning.fas("output_utbalans") as f:
+            output_utbalans(kalkfil.sheetU, resultat.balans)
+            f.rader = len(resultat.balans)
+    elif format == "csv":
+        with tidtagning.fas("output_csv") as f:
+            output_csv(kalkfil.utfilename, resultat)
+            f.rader = rader
+    else:
+        with tidtagning.fas("output_json") as f:
+            output_json(kalkfil.utfilename, resultat)
+            f.rader = rader
+    with tidtagning.fas("save"):
+        kalkfil.save()
+
+def main():
+    parser = argparse.ArgumentParser(description=USAGE,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("indata", help="excelfil med flikarna Transaktioner och Inbalans")
+    parser.add_argument("utdata", nargs="?",
+                        help="fil att skriva resultatet till: xlsx (Resultat och Utbalans), csv eller json")
+    parser.add_argument("--processer", type=int, default=1, metavar="N",
+                        help="räkna valutorna parallellt i N processer (0 = alla kärnor)")
+    parser.add_argument("--kontrollpunkt", metavar="FIL",
+                        help="räkna bara transaktioner efter kontrollpunkten i FIL (om den "
+                             "fortfarande gäller) och spara en ny kontrollpunkt där efteråt")
+    parser.add_argument("--transaktioner", metavar="FIL",
+                        help="läs transaktionerna från FIL (.parquet, .arrow eller .feather) "
+                             "istället för fliken Transaktioner")
+    parser.add_argument("--spara-transaktioner", metavar="FIL",
+                        help="skriv de inlästa transaktionerna till FIL (.parquet, .arrow eller .feather)")
+    tidtagning.lägg_till_argument(parser)
+    args = parser.parse_args()
+    tidtagning.start_från_argument(args)
+    for filnamn in (args.transaktioner, args.spara_transaktioner):
+        if filnamn and not huvudbok.är_huvudbok(filnamn):
+            sys.exit("Error: " + filnamn + " ska sluta på .parquet, .arrow eller .feather")
+
+    with tidtagning.fas("läs arbetsbok"):
+        kalkfil = Kalkfil(args.indata, args.utdata, not args.transaktioner)
+    with tidtagning.fas("read_inbalans") as f:
+        balans = read_inbalans(kalkfil.sheetI)
+        f.rader = len(balans)
+    with tidtagning.fas("read_transactions") as f:
+        if args.transaktioner:
+            translist = read_ledger(args.transaktioner)
+        else:
+            translist = read_transactions(kalkfil.sheetT)
+        f.rader = len(translist)
+    if args.spara_transaktioner:
+        with tidtagning.fas("spara transaktioner") as f:
+            huvudbok.skriv(args.spara_transaktioner, translist)
+            f.rader = len(translist)
+    totalt = (0, 0, 0)
+    att_räkna = translist
+    fortsättning = None
+    if args.kontrollpunkt:
+        inbalans_hash = hash_inbalans(balans)
+        kp = load_checkpoint(args.kontrollpunkt)
+        fortsättning = kp and apply_checkpoint(kp, balans, translist)
+        if fortsättning:
+            att_räkna, totalt = fortsättning
+    with tidtagning.fas("sort_check_transactions") as f:
+        transtable = sort_check_transactions(balans, att_räkna)
+        f.rader = len(att_räkna)
+    with tidtagning.fas("beräkna") as f:
+        resultat = beräkna(balans, transtable, compute_konto, args.processer, totalt,
+                           kontrollpunkt=bool(fortsättning))
+        f.rader = len(att_räkna)
+    if args.kontrollpunkt:
+        save_checkpoint(args.kontrollpunkt, inbalans_hash, translist, resultat)
+    output_all(kalkfil, resultat)
+    print(DIV)
+    tidtagning.slut()
+    print("Klar!")
 
-kalkfil = Kalkfil()
-balans = read_inbalans(kalkfil.sheetI)
-translist = read_transactions(kalkfil.sheetT)
-transtable = sort_check_transactions(balans, translist)
-output_results(kalkfil.sheetR, balans, transtable)
-output_utbalans(kalkfil.sheetU, balans)
-kalkfil.save()
-print(DIV)
-print("Klar!")
+    #print(balans)
+    #print(transtable)
 
-#print(balans)
-#print(transtable)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+#
+# pipeline.py, kör alla börsloggar i en katalog hela vägen till deklarationen
+#
+# Varje csv-fil i katalogen känns igen på rubrikraden och körs genom rätt
+# process (crypto.com, Nexo eller Gnosis). Processerna körs parallellt i var
+# sin process och delar kurscache via SQLite. Resultaten läggs ihop, sorteras
+# på datum och räknas direkt med GOB-beräkningen i kryptodeklaration.py, med
+# inbalansen från excelfilen. Inga resultat_*.csv behöver klistras in för hand.
+#
+# Exempel:
+#   pipeline.py exporter/ bok.xlsx resultat.xlsx
+#   pipeline.py exporter/ bok.xlsx resultat.json --processer 0
+#   pipeline.py exporter/ bok.xlsx resultat.json --huvudbok transaktioner.parquet
+
+import sys, os, csv, argparse, importlib, itertools
+from operator import itemgetter
+import concurrent.futures
+import valuta, resultatfil, tidtagning, huvudbok
+import kryptodeklaration as kd
+
+# Kurserna för alla loggar hämtas först av huvudprocessen, så att samma
+# kurser inte hämtas av flera processer. Processerna läser sedan bara kurser
+# som redan finns i kurscachen.
+#
+# Process och kolumner som måste finnas i rubrikraden för att känna igen loggen
+BÖRSER = [
+    ("process_crypto_com", ["Timestamp (UTC)", "Transaction Kind", "Native Amount (in USD)"]),
+    ("process_nexo", ["Transaction", "Type", "USD Equivalent", "Date / Time (UTC)"]),
+    ("process_gnosiswallet", ["Transaction Hash", "TokenSymbol", "USDValueDayOfTx"]),
+]
+
+# Kurscachen som delas av alla processer, måste tåla flera skrivare samtidigt
+KURSCACHE = "valutor.sqlite"
+
+def känn_igen(loggfil):
+    """Returnera processens modulnamn för loggfilen, eller None"""
+    with open(loggfil, newline='', encoding='utf-8-sig') as f:
+        rubrik = next(csv.reader(f), [])
+    for modulnamn, kolumner in BÖRSER:
+        if all(k in rubrik for k in kolumner):
+            return modulnamn
+    return None
+
+def hitta_loggar(katalog):
+    """Alla kända loggar i katalogen som (modulnamn, filnamn), i namnordning"""
+    loggar = []
+    for namn in sorted(os.listdir(katalog)):
+        filnamn = os.path.join(katalog, namn)
+        if not namn.lower().endswith(".csv") or not os.path.isfile(filnamn):
+            continue
+        modulnamn = känn_igen(filnamn)
+        if modulnamn:
+            print("  ", namn, "->", modulnamn)
+            loggar.append((modulnamn, filnamn))
+        else:
+            print("  ", namn, "okänt format, hoppas över")
+    return loggar
+
+def förbered_kurscache(kurscache):
+    """Skapa den delade kurscachen från valuta.CACHEFILE första gången"""
+    if os.path.exists(kurscache) or not os.path.exists(valuta.CACHEFILE):
+        return
+    if valuta.CACHEFILE == kurscache:
+        return
+    print("Kopierar kurser från", valuta.CACHEFILE, "till", kurscache)
+    c = valuta.open_cache(kurscache)
+    c.flush_batch = None
+    for v, kurser in itertools.groupby(valuta.open_cache(valuta.CACHEFILE).items(), itemgetter(0)):
+        c.put_many(v, {d: kurs for _, d, kurs in kurser})
+    c.flush()
+
+def förhämta(loggar, kurscache):
+    """Hämta alla kurser som loggarnas processer behöver till kurscachen"""
+    valuta.CACHEFILE = kurscache
+    behov = set()
+    for modulnamn, loggfil in loggar:
+        behov |= importlib.import_module(modulnamn).kursbehov(loggfil)
+    valuta.prefetch(behov)
+    valuta.stäng_cache()
+    return len(behov)
+
+def kör_process(modulnamn, loggfil, kurscache, tidtagen=False):
+    """Körs i en arbetsprocess: processa loggfil och returnera resultatraderna
+    och kursuppslagens tider (tidtagning.valuta_statistik, om tidtagen)"""
+    valuta.CACHEFILE = kurscache
+    # Poolen återanvänder processerna, räkna bara denna loggs anrop
+    valuta.nollställ_nätverk()
+    if tidtagen:
+        tidtagning.start()
+    modul = importlib.import_module(modulnamn)
+    f = resultatfil.Resultatfil(None)
+    modul.processfile(loggfil, f)
+    valuta.cache().flush()
+    return f.rader, tidtagning.valuta_statistik() if tidtagen else None
+
+def transaktioner(rader):
+    """Resultatrader från en process som Transaktion-objekt. Gnosis kallar
+    beloppskolumnen "Belopp SEK", döps om så att tabellen känns igen."""
+    rader = [["Belopp" if k == "Belopp SEK" else k for k in rad] if "Datum" in rad else rad
+             for rad in rader]
+    return kd.read_transaction_rows(rader)
+
+def kör_alla(loggar, kurscache=KURSCACHE, processer=None):
+    """Kör alla loggar parallellt, returnerar alla transaktioner sorterade på datum"""
+    translist = []
+    with concurrent.futures.ProcessPoolExecutor(processer) as pool:
+        jobb = [(loggfil, pool.submit(kör_process, modulnamn, loggfil, kurscache,
+                                      tidtagning.aktiv()))
+                for modulnamn, loggfil in loggar]
+        for loggfil, j in jobb:
+            rader, stat = j.result()
+            tidtagning.lägg_till_valuta(stat)
+            txs = transaktioner(rader)
+            print(os.path.basename(loggfil) + ":", len(txs), "transaktioner")
+            translist.extend(txs)
+    # Stabil sortering, samma dag behåller loggarnas ordning
+    translist.sort(key=lambda tx: tx.datum)
+    return translist
+
+def main():
+    parser = argparse.ArgumentParser(description="Kör alla börsloggar i en katalog och räkna deklarationen")
+    parser.add_argument("katalog", help="katalog med exporterade csv-loggar")
+    parser.add_argument("indata", help="excelfil med fliken Inbalans")
+    parser.add_argument("utdata", nargs="?",
+                        help="fil att skriva resultatet till: xlsx, csv eller json (annars indatafilen)")
+    parser.add_argument("--kurscache", default=KURSCACHE,
+                        help="delad kurscache (SQLite), standard " + KURSCACHE)
+    parser.add_argument("--bokens-transaktioner", action="store_true",
+                        help="räkna även med transaktionerna i excelfilens flik Transaktioner")
+    parser.add_argument("--huvudbok", metavar="FIL",
+                        help="skriv alla transaktioner, sorterade, till FIL (.parquet, .arrow eller .feather)")
+    parser.add_argument("--processer", type=int, default=0, metavar="N",
+                        help="antal parallella processer (0 = alla kärnor)")
+    tidtagning.lägg_till_argument(parser)
+    args = parser.parse_args()
+    tidtagning.start_från_argument(args)
+
+    print("Loggar i", args.katalog + ":")
+    loggar = hitta_loggar(args.katalog)
+    if not loggar:
+        sys.exit("Error: inga kända loggar i " + args.katalog)
+    if not args.kurscache.endswith((".sqlite", ".sqlite3", ".db")):
+        sys.exit("Error: kurscachen måste vara en SQLite-fil för att delas mellan processerna")
+    if args.huvudbok and not huvudbok.är_huvudbok(args.huvudbok):
+        sys.exit("Error: " + args.huvudbok + " ska sluta på .parquet, .arrow eller .feather")
+    förbered_kurscache(args.kurscache)
+    print(kd.DIV)
+    with tidtagning.fas("hämta kurser") as f:
+        f.rader = förhämta(loggar, args.kurscache)
+    with tidtagning.fas("processer") as f:
+        translist = kör_alla(loggar, args.kurscache, args.processer or None)
+        f.rader = len(translist)
+    print(kd.DIV)
+
+    with tidtagning.fas("läs arbetsbok"):
+        kalkfil = kd.Kalkfil(args.indata, args.utdata, args.bokens_transaktioner)
+        balans = kd.read_inbalans(kalkfil.sheetI)
+        if args.bokens_transaktioner:
+            translist.extend(kd.read_transactions(kalkfil.sheetT))
+    if args.huvudbok:
+        with tidtagning.fas("spara huvudbok") as f:
+            huvudbok.skriv(args.huvudbok, sorted(translist, key=lambda tx: tx.datum))
+            f.rader = len(translist)
+    with tidtagning.fas("sort_check_transactions") as f:
+        transtable = kd.sort_check_transactions(balans, translist)
+        f.rader = len(translist)
+    with tidtagning.fas("beräkna") as f:
+        resultat = kd.beräkna(balans, transtable, kd.compute_konto, args.processer)
+        f.rader = len(translist)
+    kd.output_all(kalkfil, resultat)
+    print(kd.DIV)
+    tidtagning.slut()
+    print("Klar!")
+
+if __name__ == "__main__":
+    main()
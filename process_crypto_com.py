@@ -63,7 +63,7 @@ POLICY_OTHER = [
     'card_top_up'                     # Samma som viban_exchange till FIAT
 ]
 
-import sys, valuta
+import sys, valuta, csvlogg, resultatfil, resultatcache
 
 UTFIL = "resultat_crypto_com.csv"
 
@@ -73,18 +73,29 @@ def main():
         print("Utdata hamnar alltid i resultat_crypto_com.csv")
         exit(1)
     loggfil = sys.argv[1]
-    processfile(loggfil, UTFIL)
+    # Kör bara om loggen eller policyn har ändrats, nya rader läggs till
+    resultatcache.kör(processfile, loggfil, UTFIL, sys.modules[__name__],
+                      nyast_först=True, huvudrader=2)
+
+def kursbehov(loggfil):
+    """Alla (valuta, datum) som processfile() slår upp kurser för"""
+    behov = set()
+    for splitted in csvlogg.rader(loggfil):
+        date_time, kind = splitted[0], splitted[9]
+        if kind not in POLICY_IGNORE and kind not in POLICY_IGNORE_WARN:
+            behov.add(("usd", date_time.split(" ")[0]))
+    return behov
 
 def processfile(loggfil, utfil):
-    infil = open(loggfil)
-    infil.readline() # skip header line
-    lines = infil.readlines()
-    infil.close()
-    f = open(utfil, "w")
-    print("Crypto.com", file=f)
-    print("Datum,Var,Händelse,Antal,Valuta,Belopp", file=f)
-    for line in reversed(lines):
-        splitted = line.rstrip().split(",")
+    # Första passet: samla alla datum som behöver USD-kurs och hämta dem i
+    # ett svep, andra passet gör sedan bara uppslag i minnet
+    valuta.prefetch(kursbehov(loggfil))
+
+    f = resultatfil.öppna(utfil)
+    f.writerow(("Crypto.com",))
+    f.writerow(("Datum", "Var", "Händelse", "Antal", "Valuta", "Belopp"))
+    # Loggen har senaste transaktionen först, läs den bakifrån
+    for splitted in csvlogg.rader_kronologiskt(loggfil):
         date_time, desc, currency1, amount1, currency2, amount2, _, _, amountUSD, kind, hash = splitted
         if kind in POLICY_IGNORE:
             continue
@@ -101,20 +112,22 @@ def processfile(loggfil, utfil):
             usdkurs = valuta.lookup(date, "usd")
             amountSEK = round(amountUSD*usdkurs,2)
             if amount1 >= 0:
-                print(f"{date},{desc},köp,{amount1},{currency1},{amountSEK}", file=f)
+                f.writerow((date, desc, "köp", amount1, currency1, amountSEK))
             else:
                 # Egentligen en korrigering av tidigare "Köp", men köp får ej vara negativt
                 # Hantera som sälj (försummbara belopp ändå)
-                print(f"{date},{desc},sälj,{amount1},{currency1},{amountSEK}", file=f)
+                f.writerow((date, desc, "sälj", amount1, currency1, amountSEK))
 
         elif kind in POLICY_INTEREST:
             # Ska bli ränta i redovisningen
             usdkurs = valuta.lookup(date, "usd")
-            print(f"{date},{desc},ränta,{amount1},{currency1},{amountSEK}", file=f)
+            amountSEK = round(amountUSD*usdkurs,2)
+            f.writerow((date, desc, "ränta", amount1, currency1, amountSEK))
             
         elif kind in POLICY_OTHER:
             # Utlåning till earn, växling till konstgjord valuta
             usdkurs = valuta.lookup(date, "usd")
+            amountSEK = round(amountUSD*usdkurs,2)
             if kind == 'crypto_earn_program_created':
                 currency2 = "crypto" + currency1
                 amount2 = -amount1
@@ -127,20 +140,20 @@ def processfile(loggfil, utfil):
                 kind = 'crypto_exchange'
                 
             if kind == 'crypto_exchange':
-                print(f"{date},{desc},sälj,{amount1},{currency1},{amountSEK}", file=f)
-                print(f",,köp,{amount2},{currency2},{amountSEK}", file=f)
+                f.writerow((date, desc, "sälj", amount1, currency1, amountSEK))
+                f.writerow(("", "", "köp", amount2, currency2, amountSEK))
             elif kind == 'viban_purchase' or kind == 'recurring_buy_order':
-                print(f"{date},{desc},köp,{amount2},{currency2},{amountSEK}", file=f)
+                f.writerow((date, desc, "köp", amount2, currency2, amountSEK))
             elif kind == 'crypto_payment_refund':
-                print(f"{date},{desc},köp,{amount1},{currency1},{amountSEK}", file=f)
+                f.writerow((date, desc, "köp", amount1, currency1, amountSEK))
             elif kind == 'nft_payout_credited':
-                print(f"{date},{desc},köp,{amount1},{currency1},{amountSEK}", file=f)
+                f.writerow((date, desc, "köp", amount1, currency1, amountSEK))
             elif kind == 'crypto_viban_exchange':
-                print(f"{date},{desc},sälj,{amount1},{currency1},{amountSEK}", file=f)
+                f.writerow((date, desc, "sälj", amount1, currency1, amountSEK))
             elif kind == 'crypto_payment':
-                print(f"{date},{desc},sälj,{amount1},{currency1},{amountSEK}", file=f)
+                f.writerow((date, desc, "sälj", amount1, currency1, amountSEK))
             elif kind == 'card_top_up':
-                print(f"{date},{desc},sälj,{amount1},{currency1},{-amountSEK}", file=f)
+                f.writerow((date, desc, "sälj", amount1, currency1, -amountSEK))
             else:
                 raise Exception("Okänd POLICY_OTHER:", kind)
         else:
@@ -11,9 +11,10 @@
 # Min plånboksadress (sätts i process_gnosiswallet_config.py):
 from process_gnosiswallet_config import MY_ADDRESS
 
-import sys, csv, os
-import valuta
+import sys, csv, os, heapq, tempfile, functools
+import valuta, resultatfil, resultatcache
 from collections import defaultdict
+from operator import itemgetter
 
 UTFIL = "resultat_gnosiswallet.csv"
 
@@ -24,18 +25,66 @@ def normalisera_symbol(sym):
     return "CRC" if sym in CRC_VARIANTER else sym
 
 
+# Största antal nycklar i varje minne för kurser och coin-id. Samma datum och
+# symbol återkommer i tusentals transaktioner, uppslagen görs en gång per
+# nyckel och minnet töms i början av varje processfile().
+MINNE = 4096
+
+
+@functools.lru_cache(maxsize=MINNE)
+def coinid(sym):
+    """valuta.translate() med minne, sym är normaliserad"""
+    return valuta.translate(sym)
+
+
+@functools.lru_cache(maxsize=MINNE)
+def sek_per_usd(date):
+    return valuta.lookup(date, "usd")
+
+
+@functools.lru_cache(maxsize=MINNE)
+def token_kurs(date, sym):
+    """(USD per token, SEK per USD) för datum och normaliserad symbol"""
+    return valuta.lookup(date, coinid(sym)), sek_per_usd(date)
+
+
+def rensa_minnen():
+    for f in (coinid, sek_per_usd, token_kurs):
+        f.cache_clear()
+
+
+def skriv_minnen():
+    """Skriv träffar och missar för minnena"""
+    delar = []
+    for namn, f in (("coin-id", coinid), ("SEK/USD", sek_per_usd), ("tokenkurs", token_kurs)):
+        info = f.cache_info()
+        uppslag = info.hits + info.misses
+        if uppslag:
+            delar.append(f"{namn} {info.hits}/{uppslag} träffar ({100 * info.hits / uppslag:.0f} %)")
+    if delar:
+        print("Kursminne:", ", ".join(delar))
+
+
 def token_till_sek(date, sym, usd_från_csv, antal):
     """Beräkna SEK-värde för en token.
     Använder USD-värde från CSV om tillgängligt, annars prisuppslag via valuta."""
     if usd_från_csv > 0:
-        return round(usd_från_csv * valuta.lookup(date, "usd"), 2)
+        return round(usd_från_csv * sek_per_usd(date), 2)
     elif antal > 0:
-        usd_per_token = valuta.lookup(date, valuta.translate(sym))
-        sek_per_usd = valuta.lookup(date, "usd")
-        return round(antal * usd_per_token * sek_per_usd, 2)
+        usd_per_token, sek = token_kurs(date, sym)
+        return round(antal * usd_per_token * sek, 2)
     return 0
 
 
+def token_behov(date, sym, usd_från_csv, antal):
+    """Returnera de (valuta, datum) som token_till_sek() kommer att slå upp."""
+    if usd_från_csv > 0:
+        return {("usd", date)}
+    elif antal > 0:
+        return {(coinid(sym), date), ("usd", date)}
+    return set()
+
+
 def parse_amount(s):
     """Hantera tusentalsavgränsare (kommatecken) i tokenbelopp."""
     return float(s.replace(",", ""))
@@ -53,89 +102,240 @@ def main():
         print("Ange csv-filens namn som indata (Gnosis Wallet token export)!")
         print("Utdata hamnar alltid i", UTFIL)
         exit(1)
-    processfile(sys.argv[1], UTFIL)
+    # Kör bara om exporten eller inställningarna har ändrats, nya rader läggs till
+    resultatcache.kör(processfile, sys.argv[1], UTFIL, sys.modules[__name__],
+                      nyast_först=False, huvudrader=1,
+                      transaktionskolumn="Transaction Hash")
 
 
-def processfile(loggfil, utfil):
-    # Läs in alla rader med csv-modulen (hanterar citattecken och kommatecken i fält)
-    with open(loggfil, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        all_rows = list(reader)
-
-    # Gruppera rader per transaction hash, bevara filordningen
-    transactions = defaultdict(list)
-    tx_order = []
-    for row in all_rows:
-        txhash = row["Transaction Hash"]
-        if txhash not in transactions:
-            tx_order.append(txhash)
-        transactions[txhash].append(row)
+# Kolumnerna som används, i den ordning rader() returnerar dem
+KOLUMNER = ("Transaction Hash", "Blockno", "DateTime (UTC)", "From", "To",
+            "TokenValue", "USDValueDayOfTx", "ContractAddress", "TokenSymbol")
+
+# Antal rader som sorteras i minnet åt gången vid extern sortering
+SORTBLOCK = 100000
+
+
+class EjSammanhängande(Exception):
+    """En transaktionshash förekommer på flera ställen i loggen"""
+
+
+def rader(loggfil):
+    """Loggens rader som tupler med kolumnerna i KOLUMNER, i filordning"""
+    # utf-8-sig: exporter som sparats om i t ex Excel börjar med en BOM
+    with open(loggfil, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        rubrik = next(reader, [])
+        saknas = [k for k in KOLUMNER if k not in rubrik]
+        if saknas:
+            sys.exit("Error: kolumner saknas i " + loggfil + ": " + ", ".join(saknas))
+        välj = itemgetter(*(rubrik.index(k) for k in KOLUMNER))
+        for row in reader:
+            if row:
+                yield välj(row)
+
 
+def grupper(loggfil, kontroll=True):
+    """Returnera (hash, rader) för varje transaktion i filordning, utan att
+    läsa in hela loggen. Exporten är sorterad på block, så en transaktions
+    rader ligger i följd. Det kontrolleras med de hashar som redan setts i
+    samma block (blocknumren måste komma i stigande eller fallande ordning).
+    Annars avbryts läsningen med EjSammanhängande. Utan kontroll (loggen
+    från sortera_på_hash) räcker det att raderna ligger i följd."""
+    sedda = set()       # avslutade hashar i aktuellt block
+    block = None
+    riktning = 0
+    txhash = None
+    tx_rows = []
+    for row in rader(loggfil):
+        if row[0] == txhash:
+            tx_rows.append(row)
+            continue
+        if tx_rows:
+            yield txhash, tx_rows
+            sedda.add(txhash)
+        txhash = row[0]
+        tx_rows = [row]
+        if not kontroll:
+            continue
+        if row[1] != block:
+            if block is not None:
+                steg = 1 if int(row[1]) > int(block) else -1
+                if riktning and steg != riktning:
+                    raise EjSammanhängande("blocknumren är inte sorterade")
+                riktning = steg
+            block = row[1]
+            sedda.clear()
+        elif txhash in sedda:
+            raise EjSammanhängande("transaktion " + txhash[:16] + "... är uppdelad")
+    if tx_rows:
+        yield txhash, tx_rows
+
+
+def sortera_på_hash(loggfil):
+    """Extern sortering av loggen för när grupper() inte räcker. Skriver en
+    temporär csv-fil med kolumnerna i KOLUMNER där varje transaktions rader
+    ligger i följd, transaktionerna i den ordning de först förekommer och
+    raderna i filordning. Sorterar SORTBLOCK rader i taget i minnet och
+    slår ihop blocken, bara hasharnas ordningsnummer hålls i minnet.
+    Filerna skapas i tempfile.gettempdir(). Returnerar filnamnet,
+    anroparen tar bort filen."""
+    katalog = tempfile.gettempdir()
+    ordning = {}
+    blockfiler = []
+
+    def skriv_block(block):
+        block.sort()
+        fd, namn = tempfile.mkstemp(suffix=".csv", dir=katalog)
+        blockfiler.append(namn)
+        with os.fdopen(fd, "w", newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows((nr, radnr) + row for (nr, radnr), row in block)
+
+    def läs_block(namn):
+        with open(namn, newline='', encoding='utf-8-sig') as f:
+            for row in csv.reader(f):
+                yield (int(row[0]), int(row[1])), tuple(row[2:])
+
+    try:
+        block = []
+        for radnr, row in enumerate(rader(loggfil)):
+            nr = ordning.setdefault(row[0], len(ordning))
+            block.append(((nr, radnr), row))
+            if len(block) >= SORTBLOCK:
+                skriv_block(block)
+                block = []
+        if block:
+            skriv_block(block)
+        del ordning
+        fd, utfil = tempfile.mkstemp(suffix=".csv", dir=katalog)
+        with os.fdopen(fd, "w", newline='', encoding='utf-8') as f:
+            w = csv.writer(f)
+            w.writerow(KOLUMNER)
+            w.writerows(row for _, row in heapq.merge(*map(läs_block, blockfiler)))
+    finally:
+        for namn in blockfiler:
+            os.remove(namn)
+    return utfil
+
+
+def nettoflöden(tx_rows, my_addr):
+    """Nettoflöde per token för min adress i en transaktion.
+    Returnerar (inkommande, utgående, usd_in), positiva antal per token"""
+    # Positivt = jag fick tokens, negativt = jag skickade tokens
+    net = defaultdict(float)
+    usd_in = defaultdict(float)   # USD-värde för mottagna tokens (när tillgängligt)
+    for _, _, _, from_addr, to_addr, value, usd, contract, symbol in tx_rows:
+        # skip old EURe emoney
+        if contract == "0xcb444e90d8198415266c6a2724b7900fb12fc56e":
+            continue
+        from_addr = from_addr.lower()
+        to_addr = to_addr.lower()
+        symbol = normalisera_symbol(symbol)
+        amount = parse_amount(value)
+        usd = parse_usd(usd)
+
+        if to_addr == my_addr:
+            net[symbol] += amount
+            if usd is not None:
+                usd_in[symbol] += usd
+        if from_addr == my_addr:
+            net[symbol] -= amount
+
+    significant = {sym: amt for sym, amt in net.items() if abs(amt) > 1e-10}
+    incoming = {sym: amt for sym, amt in significant.items() if amt > 0}
+    outgoing = {sym: -amt for sym, amt in significant.items() if amt < 0}
+    return incoming, outgoing, usd_in
+
+
+def swappar(loggfil, my_addr, info=False, kontroll=True):
+    """Returnera (hash, datum, inkommande, utgående, usd_in) för varje swap
+    i loggen, en transaktion i taget. Med info skrivs övriga transaktioner ut."""
+    for txhash, tx_rows in grupper(loggfil, kontroll):
+        date = tx_rows[0][2].split(" ")[0]
+        incoming, outgoing, usd_in = nettoflöden(tx_rows, my_addr)
+        if not (incoming and outgoing):
+            if info:
+                print(f"Info: tx {txhash[:16]}... ({date}) - ej swap, hoppas över (in={dict(incoming)}, ut={dict(outgoing)})")
+            continue
+        yield txhash, date, incoming, outgoing, usd_in
+
+
+def swappars_behov(loggfil, my_addr, kontroll=True):
+    """Alla (valuta, datum) som behövs för att värdera loggens swappar"""
+    behov = set()
+    for txhash, date, incoming, outgoing, usd_in in swappar(loggfil, my_addr, False, kontroll):
+        for sym, amt in incoming.items():
+            behov |= token_behov(date, sym, usd_in.get(sym, 0), amt)
+    return behov
+
+
+def kursbehov(loggfil):
+    """Alla (valuta, datum) som processfile() slår upp kurser för"""
     my_addr = MY_ADDRESS.lower()
+    try:
+        return swappars_behov(loggfil, my_addr)
+    except EjSammanhängande:
+        sorterad = sortera_på_hash(loggfil)
+        try:
+            return swappars_behov(sorterad, my_addr, False)
+        finally:
+            os.remove(sorterad)
+
+
+def processfile(loggfil, utfil):
+    # Loggen läses två gånger, en transaktion i taget. Första passet samlar
+    # vilka kurser som behövs och de hämtas i ett svep, andra passet räknar
+    # om nettoflödena och skriver resultatet. Ligger inte transaktionernas
+    # rader i följd sorteras loggen först om till en temporär fil.
+    my_addr = MY_ADDRESS.lower()
+    rensa_minnen()
+    sorterad = None
+    kontroll = True
+    try:
+        try:
+            behov = swappars_behov(loggfil, my_addr)
+        except EjSammanhängande as e:
+            print("Info:", str(e) + ", sorterar om", loggfil, "på transaktion")
+            sorterad = loggfil = sortera_på_hash(loggfil)
+            kontroll = False
+            behov = swappars_behov(loggfil, my_addr, kontroll)
+
+        valuta.prefetch(behov)
+
+        with resultatfil.öppna(utfil) as f:
+            f.writerow(("Datum", "Var", "Händelse", "Antal", "Valuta", "Belopp SEK", "Hash"))
+
+            for txhash, date, incoming, outgoing, usd_in in swappar(loggfil, my_addr, True, kontroll):
+                short_hash = txhash[:16] + "..."
+
+                # Beräkna swap-värdet i SEK från inkommande tokens med känt marknadspris
+                swap_sek = sum(
+                    token_till_sek(date, sym, usd_in.get(sym, 0), amt)
+                    for sym, amt in incoming.items()
+                )
+                # Utgående (sälj) först: första raden får swap_sek, resten 0
+                rows_to_write = []
+                for i, sym in enumerate(sorted(outgoing)):
+                    rows_to_write.append((-round(outgoing[sym], 8), sym, swap_sek if i == 0 else 0, "sälj"))
+                # Inkommande (köp): alla rader får swap_sek (samma totala handelsvärde)
+                for sym in sorted(incoming):
+                    rows_to_write.append((round(incoming[sym], 8), sym, swap_sek, "köp"))
+                var_label = "Gnosis wallet, swap"
 
-    with open(utfil, "w", newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(["Datum", "Var", "Händelse", "Antal", "Valuta", "Belopp SEK", "Hash"])
-
-        for txhash in tx_order:
-            tx_rows = transactions[txhash]
-            date = tx_rows[0]["DateTime (UTC)"].split(" ")[0]
-            short_hash = txhash[:16] + "..."
-
-            # Beräkna nettoflöde per token för min adress
-            # Positivt = jag fick tokens, negativt = jag skickade tokens
-            net = defaultdict(float)
-            usd_in = defaultdict(float)   # USD-värde för mottagna tokens (när tillgängligt)
-            for row in tx_rows:
-                from_addr = row["From"].lower()
-                to_addr = row["To"].lower()
-                symbol = normalisera_symbol(row["TokenSymbol"])
-                amount = parse_amount(row["TokenValue"])
-                usd = parse_usd(row["USDValueDayOfTx"])
-
-                # skip old EURe emoney
-                if row["ContractAddress"] == "0xcb444e90d8198415266c6a2724b7900fb12fc56e":
-                    continue
-                
-                if to_addr == my_addr:
-                    net[symbol] += amount
-                    if usd is not None:
-                        usd_in[symbol] += usd
-                if from_addr == my_addr:
-                    net[symbol] -= amount
-
-            significant = {sym: amt for sym, amt in net.items() if abs(amt) > 1e-10}
-            incoming = {sym: amt for sym, amt in significant.items() if amt > 0}
-            outgoing = {sym: -amt for sym, amt in significant.items() if amt < 0}
-
-            if not (incoming and outgoing):
-                print(f"Info: tx {short_hash} ({date}) - ej swap, hoppas över (in={dict(incoming)}, ut={dict(outgoing)})")
-                continue
-
-            # Beräkna swap-värdet i SEK från inkommande tokens med känt marknadspris
-            swap_sek = sum(
-                token_till_sek(date, sym, usd_in.get(sym, 0), amt)
-                for sym, amt in incoming.items()
-            )
-            # Utgående (sälj) först: första raden får swap_sek, resten 0
-            rows_to_write = []
-            for i, sym in enumerate(sorted(outgoing)):
-                rows_to_write.append((-round(outgoing[sym], 8), sym, swap_sek if i == 0 else 0, "sälj"))
-            # Inkommande (köp): alla rader får swap_sek (samma totala handelsvärde)
-            for sym in sorted(incoming):
-                rows_to_write.append((round(incoming[sym], 8), sym, swap_sek, "köp"))
-            var_label = "Gnosis wallet, swap"
-
-            for i, (antal, sym, sek, händelse) in enumerate(rows_to_write):
-                writer.writerow([
-                    date if i == 0 else "",
-                    var_label if i == 0 else "",
-                    händelse,
-                    antal,
-                    sym,
-                    sek,
-                    short_hash if i == 0 else ""
-                ])
+                for i, (antal, sym, sek, händelse) in enumerate(rows_to_write):
+                    f.writerow((
+                        date if i == 0 else "",
+                        var_label if i == 0 else "",
+                        händelse,
+                        antal,
+                        sym,
+                        sek,
+                        short_hash if i == 0 else ""
+                    ))
+        skriv_minnen()
+    finally:
+        if sorterad:
+            os.remove(sorterad)
 
 
 if __name__ == "__main__":
@@ -46,7 +46,7 @@ POLICY_OTHER = [
     'Deposit To Exchange',       # Köp krypto för fiat
 ]
 
-import sys, valuta
+import sys, valuta, csvlogg, resultatfil, resultatcache
 
 UTFIL = "resultat_nexo.csv"
 
@@ -56,18 +56,29 @@ def main():
         print("Utdata hamnar alltid i resultat_nexo.csv")
         exit(1)
     loggfil = sys.argv[1]
-    processfile(loggfil, UTFIL)
+    # Kör bara om loggen eller policyn har ändrats, nya rader läggs till
+    resultatcache.kör(processfile, loggfil, UTFIL, sys.modules[__name__],
+                      nyast_först=True, huvudrader=2)
+
+def kursbehov(loggfil):
+    """Alla (valuta, datum) som processfile() slår upp kurser för"""
+    behov = set()
+    for splitted in csvlogg.rader(loggfil):
+        kind, date_time = splitted[1], splitted[10]
+        if kind not in POLICY_IGNORE:
+            behov.add(("usd", date_time.split(" ")[0]))
+    return behov
 
 def processfile(loggfil, utfil):
-    infil = open(loggfil)
-    infil.readline() # skip header line
-    lines = infil.readlines()
-    infil.close()
-    f = open(utfil, "w")
-    print("Nexo", file=f)
-    print("Datum,Var,Händelse,Antal,Valuta,Belopp", file=f)
-    for line in reversed(lines):
-        splitted = line.rstrip().split(",")
+    # Första passet: samla alla datum som behöver USD-kurs och hämta dem i
+    # ett svep, andra passet gör sedan bara uppslag i minnet
+    valuta.prefetch(kursbehov(loggfil))
+
+    f = resultatfil.öppna(utfil)
+    f.writerow(("Nexo",))
+    f.writerow(("Datum", "Var", "Händelse", "Antal", "Valuta", "Belopp"))
+    # Loggen har senaste transaktionen först, läs den bakifrån
+    for splitted in csvlogg.rader_kronologiskt(loggfil):
         _, kind, currency1, amount1, currency2, amount2, amountUSD, fee, currencyFee, desc, date_time = splitted
         if fee != "-":
             # Fee inräknad redan så förmodligen behövs ingen åtgärd
@@ -85,11 +96,10 @@ def processfile(loggfil, utfil):
         
         if kind in POLICY_GIFT:
             # Skattefritt köp till aktuell kurs, utgå från USD och omvandla till SEK
-            print(f"{date},{kind},köp,{amount1},nexo{currency1},{amountSEK}", file=f)
+            f.writerow((date, kind, "köp", amount1, "nexo" + currency1, amountSEK))
         elif kind in POLICY_INTEREST:
             # Ska bli ränta i redovisningen, räntan kommer på nexo-skuldvalutan
-            print(f"{date},{kind},ränta," +
-                  f"{amount1},nexo{currency1},{amountSEK},,{desc}", file=f)
+            f.writerow((date, kind, "ränta", amount1, "nexo" + currency1, amountSEK, "", desc))
         elif kind in POLICY_OTHER:
             # Deposit, växling till konstgjord valuta
             if kind == 'Deposit' or kind == 'Top up Crypto' or kind == 'Transfer From Pro Wallet':
@@ -97,24 +107,21 @@ def processfile(loggfil, utfil):
                 currency2 = "nexo" + currency1
                 amount2 = -amount1
                 amountUSD = amountUSD
-                print(f"{date},{kind},sälj,{amount1},{currency1},{amountSEK}" +
-                      f",,{desc}", file=f)
-                print(f",,köp,{amount2},{currency2},{amountSEK}", file=f)
+                f.writerow((date, kind, "sälj", amount1, currency1, amountSEK, "", desc))
+                f.writerow(("", "", "köp", amount2, currency2, amountSEK))
             elif kind == 'Withdrawal' or kind == 'Transfer To Pro Wallet':
                 currency2, amount2 = currency1, -amount1
                 currency1 = "nexo" + currency2
-                print(f"{date},{kind},sälj,{amount1},{currency1},{amountSEK}" +
-                      f",,{desc}", file=f)
-                print(f",,köp,{amount2},{currency2},{amountSEK}", file=f)
+                f.writerow((date, kind, "sälj", amount1, currency1, amountSEK, "", desc))
+                f.writerow(("", "", "köp", amount2, currency2, amountSEK))
             elif kind == 'Deposit To Exchange':
                 # Om EUR så ska det nog inte hanteras som krypto men enklast att
                 # hantera det som allt annat
-                print(f"{date},{kind},köp,{amount2},nexo{currency2},{amountSEK}" +
-                      f",,{desc}", file=f)
+                f.writerow((date, kind, "köp", amount2, "nexo" + currency2, amountSEK, "", desc))
             elif kind == 'Exchange':
                 # Växling
-                print(f"{date},{kind},sälj,{amount1},nexo{currency1},{amountSEK}", file=f)
-                print(f",,köp,{amount2},nexo{currency2},{amountSEK}", file=f)
+                f.writerow((date, kind, "sälj", amount1, "nexo" + currency1, amountSEK))
+                f.writerow(("", "", "köp", amount2, "nexo" + currency2, amountSEK))
             else:
                 raise Exception("Okänd POLICY_OTHER:", kind)
         else:
@@ -0,0 +1,207 @@
+#
+# Cache för processernas resultatfiler
+#
+# Bredvid resultatfilen sparas <utfil>.cache.json med hashar av indatafilen,
+# processens konstanter (POLICY_* m fl) och källkod, källkoden för modulerna
+# som alla processer använder (DELADE_MODULER), resultatfilen samt alla
+# kurser som användes. Vid nästa körning:
+#
+#  - Oförändrad indatafil: inget görs, resultatfilen är redan aktuell.
+#  - Indatafilen har fått nya rader: bara de nya raderna körs genom processen
+#    och läggs till sist i resultatfilen. Crypto.com och Nexo har senaste
+#    transaktionen först, där kommer nya rader direkt efter rubrikraden
+#    (nyast_först=True). Gnosis-exporten får nya rader sist.
+#  - Annars (ändrade policys, kurser, rader eller resultatfil): allt körs om.
+#
+# Exempel:
+#   resultatcache.kör(processfile, loggfil, UTFIL, sys.modules[__name__],
+#                     nyast_först=True, huvudrader=2)
+#
+# Nya rader förutsätts vara hela transaktioner. Anges transaktionskolumn
+# (Gnosis: "Transaction Hash") körs allt om när första nya raden tillhör
+# samma transaktion som sista gamla raden, t ex om exporten togs mitt i en
+# transaktion.
+
+import os, csv, json, hashlib, tempfile, importlib
+import valuta, resultatfil
+
+VERSION = 1
+BLOCKSTORLEK = 1 << 20
+
+# Moduler vars källkod också påverkar resultatet, ändras någon körs allt om
+DELADE_MODULER = ("valuta", "csvlogg", "resultatfil")
+
+def cachefil(utfil):
+    return utfil + ".cache.json"
+
+def hash_fil(filnamn, start=0, längd=None):
+    """sha256 av filens bytes från start, längd bytes (hela resten om None)"""
+    h = hashlib.sha256()
+    with open(filnamn, "rb") as f:
+        f.seek(start)
+        kvar = längd
+        while kvar is None or kvar > 0:
+            block = f.read(BLOCKSTORLEK if kvar is None else min(BLOCKSTORLEK, kvar))
+            if not block:
+                break
+            h.update(block)
+            if kvar is not None:
+                kvar -= len(block)
+    return h.hexdigest()
+
+def hash_konstanter(modul):
+    """Hash av modulens konstanter (globala namn med versaler, t ex
+    POLICY_IGNORE och UTFIL), dess källkod och källkoden i DELADE_MODULER"""
+    konstanter = []
+    for namn, värde in vars(modul).items():
+        if namn.isupper() and isinstance(värde, (str, int, float, list, tuple, set, frozenset, dict)):
+            # Mängder sorteras, deras ordning varierar mellan körningar
+            konstanter.append((namn, repr(sorted(värde) if isinstance(värde, (set, frozenset)) else värde)))
+    konstanter.sort()
+    h = hashlib.sha256(repr(konstanter).encode("utf-8"))
+    for filnamn in [modul.__file__] + [importlib.import_module(m).__file__ for m in DELADE_MODULER]:
+        with open(filnamn, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def indata(loggfil):
+    """Rubrikradens och datadelens längd i bytes"""
+    with open(loggfil, "rb") as f:
+        rubrik = len(f.readline())
+        storlek = f.seek(0, 2)
+    return rubrik, storlek - rubrik
+
+def läs(utfil):
+    try:
+        with open(cachefil(utfil), encoding="utf-8") as f:
+            c = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return c if c.get("version") == VERSION else None
+
+def spara(utfil, c):
+    tmp = cachefil(utfil) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(c, f, ensure_ascii=False)
+    os.replace(tmp, cachefil(utfil))
+
+def kurser_gäller(kurser):
+    """Ger kurscachen fortfarande samma värden för alla kurser?"""
+    c = valuta.cache()
+    # peek räknas inte som cacheträff eller -miss
+    return all(c.peek(v, d) == kurs for v, d, kurs in kurser)
+
+def csvrad(rad):
+    """En rad (bytes) från loggen som lista med fält"""
+    return next(csv.reader([rad.decode("utf-8-sig")]), [])
+
+def sista_raden(f, start, slut):
+    """Sista hela raden i f mellan start och slut, slut ligger efter ett radslut"""
+    bit = 4096
+    while True:
+        från = max(start, slut - bit)
+        f.seek(från)
+        data = f.read(slut - från)
+        i = data.rfind(b"\n", 0, len(data) - 1)
+        if i >= 0 or från == start:
+            return data[i + 1:]
+        bit *= 2
+
+def delad_transaktion(loggfil, rubrik, gräns, kolumn):
+    """Tillhör raderna närmast före och efter byte gräns samma transaktion
+    (samma värde i kolumnen)?"""
+    with open(loggfil, "rb") as f:
+        namn = csvrad(f.readline())
+        if kolumn not in namn:
+            return False
+        i = namn.index(kolumn)
+        före = csvrad(sista_raden(f, rubrik, gräns))
+        f.seek(gräns)
+        efter = csvrad(f.readline())
+    return len(före) > i and len(efter) > i and före[i] == efter[i]
+
+def nya_rader(loggfil, c, nyast_först, transaktionskolumn=None):
+    """Returnera (start, längd) för de nya bytes i loggfil jämfört med när
+    cachen skapades, eller None om filen har ändrats på annat sätt eller en
+    transaktion delas mellan gamla och nya rader"""
+    rubrik, datalängd = indata(loggfil)
+    gammal = c["datalängd"]
+    if rubrik != c["rubriklängd"] or datalängd < gammal:
+        return None
+    if hash_fil(loggfil, 0, rubrik) != c["rubrik"]:
+        return None
+    if nyast_först:
+        # Gamla datadelen ska ligga sist, de nya raderna före den
+        start_gammal = rubrik + datalängd - gammal
+        if hash_fil(loggfil, start_gammal, gammal) != c["data"]:
+            return None
+        start, längd = rubrik, datalängd - gammal
+        with open(loggfil, "rb") as f:
+            f.seek(start_gammal - 1)
+            if längd and f.read(1) != b"\n":
+                return None
+    else:
+        # Gamla datadelen ska ligga först och sluta med en hel rad
+        if hash_fil(loggfil, rubrik, gammal) != c["data"]:
+            return None
+        start, längd = rubrik + gammal, datalängd - gammal
+        with open(loggfil, "rb") as f:
+            f.seek(rubrik + gammal - 1)
+            if gammal and längd and f.read(1) != b"\n":
+                return None
+        if (transaktionskolumn and gammal and längd
+                and delad_transaktion(loggfil, rubrik, start, transaktionskolumn)):
+            print("Nya rader fortsätter en transaktion från förra körningen, kör om allt")
+            return None
+    return start, längd
+
+def kör(processfile, loggfil, utfil, modul, nyast_först=False, huvudrader=1,
+        transaktionskolumn=None):
+    """Kör processfile(loggfil, utfil) om resultatet inte redan finns.
+    modul är processens modul (för konstanterna), huvudrader antalet rader
+    som processen skriver först i resultatfilen (titel och rubrik) och
+    transaktionskolumn kolumnen som håller ihop en transaktions rader."""
+    konstanter = hash_konstanter(modul)
+    c = läs(utfil)
+    if c and (c["konstanter"] != konstanter or not os.path.exists(utfil)
+              or hash_fil(utfil) != c["utdata"] or not kurser_gäller(c["kurser"])):
+        c = None
+    ny = nya_rader(loggfil, c, nyast_först, transaktionskolumn) if c else None
+
+    kurser = valuta.spåra_kurser()
+    if ny and ny[1] == 0:
+        print("Oförändrad indata,", utfil, "är redan aktuell")
+        return
+    elif ny:
+        # Kör bara de nya raderna, via en temporär fil med samma rubrikrad
+        start, längd = ny
+        print("Indata har", längd, "nya bytes, lägger till i", utfil)
+        fd, tmp = tempfile.mkstemp(suffix=".csv", dir=os.path.dirname(os.path.abspath(loggfil)))
+        try:
+            with open(loggfil, "rb") as f, os.fdopen(fd, "wb") as t:
+                t.write(f.readline())
+                f.seek(start)
+                t.write(f.read(längd))
+            minne = resultatfil.Resultatfil(None)
+            processfile(tmp, minne)
+        finally:
+            os.remove(tmp)
+        with resultatfil.Resultatfil(utfil, lägg_till=True) as f:
+            for rad in minne.rader[huvudrader:]:
+                f.writerow(rad)
+        for v, d, kurs in c["kurser"]:
+            kurser.setdefault((v, d), kurs)
+    else:
+        processfile(loggfil, utfil)
+
+    rubrik, datalängd = indata(loggfil)
+    spara(utfil, {
+        "version": VERSION,
+        "konstanter": konstanter,
+        "rubriklängd": rubrik,
+        "rubrik": hash_fil(loggfil, 0, rubrik),
+        "datalängd": datalängd,
+        "data": hash_fil(loggfil, rubrik),
+        "utdata": hash_fil(utfil),
+        "kurser": sorted([v, d, kurs] for (v, d), kurs in kurser.items()),
+    })
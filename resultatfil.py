@@ -0,0 +1,65 @@
+#
+# Skriv resultatet från processerna (csv) i stora block
+#
+# Raderna samlas som tupler och skrivs med csv.writer.writerows när BUFFERT
+# rader har samlats, istället för en print() och ett write-anrop per rad.
+#
+# Exempel:
+#   with resultatfil.öppna("resultat_nexo.csv") as f:
+#       f.writerow(("Datum", "Var", "Händelse", "Antal", "Valuta", "Belopp"))
+#
+# Filnamn som slutar på .gz skrivs gzip-komprimerade. Med lägg_till=True
+# läggs raderna till sist i en befintlig fil. Med Resultatfil(None)
+# stannar raderna i minnet (som tupler) och kan läsas direkt av
+# kryptodeklaration.read_transaction_rows() utan att gå via en fil.
+
+import csv, gzip
+
+BUFFERT = 10000     # antal rader som samlas innan de skrivs
+
+class Resultatfil:
+    """Buffrad csv-skrivare för resultatrader"""
+    def __init__(self, filnamn, buffert=BUFFERT, lägg_till=False):
+        self.filnamn = filnamn
+        self.buffert = buffert
+        self.rader = []
+        self.f = None
+        self.writer = None
+        if filnamn is None:
+            return
+        läge = "a" if lägg_till else "w"
+        if filnamn.endswith(".gz"):
+            self.f = gzip.open(filnamn, läge + "t", newline='', encoding='utf-8')
+        else:
+            self.f = open(filnamn, läge, newline='', encoding='utf-8')
+        self.writer = csv.writer(self.f, lineterminator="\n")
+
+    def writerow(self, row):
+        self.rader.append(row)
+        if self.writer and len(self.rader) >= self.buffert:
+            self.flush()
+
+    def flush(self):
+        """Skriv samlade rader till filen (gör inget om raderna ska stanna i minnet)"""
+        if self.writer:
+            self.writer.writerows(self.rader)
+            self.rader = []
+
+    def close(self):
+        if self.f:
+            self.flush()
+            self.f.close()
+            self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def öppna(utfil):
+    """Returnera en Resultatfil för utfil, som kan vara ett filnamn eller en
+    redan öppnad Resultatfil (t ex Resultatfil(None) för att få raderna i minnet)"""
+    if isinstance(utfil, Resultatfil):
+        return utfil
+    return Resultatfil(utfil)
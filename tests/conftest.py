@@ -0,0 +1,43 @@
+#
+# Gemensamt för testerna
+#
+# Modulerna ligger i repots rot. De privata inställningarna (valuta_apikeys.py
+# och process_gnosiswallet_config.py) finns inte i repot och får testvärden
+# om de saknas. Kurserna kommer från stubben i benchmark.py, aldrig från nätet.
+#
+# Körs med: python -m pytest -q
+
+import os, sys, types
+import pytest
+
+ROT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROT)
+
+TESTVÄRDEN = {
+    "valuta_apikeys": {"APIKEY_CURRENCYBEACON": "test", "APIKEY_COINGECKO": "test"},
+    "process_gnosiswallet_config": {"MY_ADDRESS": "0xME00000000000000000000000000000000000001"},
+}
+
+for _namn, _värden in TESTVÄRDEN.items():
+    try:
+        __import__(_namn)
+    except ImportError:
+        _modul = types.ModuleType(_namn)
+        _modul.__dict__.update(_värden)
+        sys.modules[_namn] = _modul
+
+@pytest.fixture
+def kurser(tmp_path, monkeypatch):
+    """Stubbade kurser och en tom kurscache i tmp_path, som också blir
+    arbetskatalog. Processens kurscache stängs efteråt."""
+    import valuta, benchmark
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(valuta, "http_get", benchmark.stub_get)
+    monkeypatch.setattr(valuta, "_buckets",
+                        {l: valuta.TokenBucket(1e9, 1e9) for l in valuta.KVOTER})
+    monkeypatch.setattr(valuta, "CACHEFILE", str(tmp_path / "valutor.json"))
+    monkeypatch.setattr(valuta, "COINLIST", os.path.join(ROT, "coinlist.json"))
+    monkeypatch.setattr(valuta, "_cache", None)
+    monkeypatch.setattr(valuta, "använda_kurser", None)
+    yield valuta
+    valuta.stäng_cache()
@@ -0,0 +1,27 @@
+# Syntetiska Gnosis-exporter för testerna
+
+import csv
+from process_gnosiswallet_config import MY_ADDRESS
+
+RUBRIK = ["Transaction Hash", "Blockno", "UnixTimestamp", "DateTime (UTC)", "From", "To",
+          "TokenValue", "USDValueDayOfTx", "ContractAddress", "TokenName", "TokenSymbol"]
+ANNAN = "0x" + "1" * 40
+
+def swap(nr, dag, ut, in_):
+    """Två rader: ut (symbol, antal) skickas, in_ (symbol, antal) tas emot"""
+    tid = "2021-01-%02d 12:00:00" % dag
+    hash = "0x%064x" % nr
+    return [[hash, str(100 + nr), "0", tid, MY_ADDRESS, ANNAN, str(ut[1]), "N/A",
+             "0x" + "c" * 40, ut[0], ut[0]],
+            [hash, str(100 + nr), "0", tid, ANNAN, MY_ADDRESS, str(in_[1]), "$%.2f" % (in_[1] * 3),
+             "0x" + "c" * 40, in_[0], in_[0]]]
+
+RADER = (swap(1, 1, ("WXDAI", 100.5), ("GNO", 1.25))
+         + swap(2, 2, ("WXDAI", 669.183698), ("GNO", 7.5))
+         + swap(3, 3, ("GNO", 2.0), ("COW", 40.0)))
+
+def skriv(filnamn, rader, encoding="utf-8"):
+    with open(filnamn, "w", newline="", encoding=encoding) as f:
+        w = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator="\n")
+        w.writerow(RUBRIK)
+        w.writerows(rader)
@@ -0,0 +1,155 @@
+# Den ursprungliga renderingen av flikarna Resultat och Utbalans, cell för
+# cell, som facit för testerna av output_results() och output_utbalans().
+# Räknar själv fram resultatet med Konto.update() som originalet.
+
+import openpyxl
+
+ROWHEIGHT = 12.8
+
+
+def referens_results(sheet, balans, transtable):
+    boldfont = openpyxl.styles.Font(name='Arial',size=10,bold=True)
+    sheet["A1"].value = "Resultat"
+    sheet["A1"].font = boldfont
+    for i in range(3):
+        sheet.row_dimensions[i+1].height = ROWHEIGHT
+    row = 4
+    # Utgå från valutorna i inbalansen för att få samma sorteringsordning
+    # Dessa är ett superset av tx-valutorna
+    valutor = balans.keys()
+    h = ["Datum","Var","Händelse","Antal+","Antal-","Valuta",
+         "Belopp+", "Belopp-", None,
+         "Innehav", "GOB", "Omkostnad", "Vinst", "Förlust", "Ränta"]
+    tot_vinst = 0
+    tot_förlust = 0
+    tot_ränta = 0
+    for valuta in valutor:
+        if not valuta in transtable.keys():
+            # Alla inbalansvalutor finns kanske inte som transaktioner
+            continue
+        newh = [valuta] + h
+        for c,v in enumerate(newh):
+            cell = sheet.cell(row=row, column=c+1)
+            cell.value = v
+            cell.font = boldfont
+            if v not in [valuta, "Datum", "Var", "Händelse", "Valuta"]:
+                cell.alignment = openpyxl.styles.Alignment(horizontal="right")
+        sheet.row_dimensions[row].height = ROWHEIGHT
+        row += 1
+        konto = balans[valuta]
+        sheet.cell(row=row, column=11).value = konto.innehav
+        sheet.cell(row=row, column=12).value = konto.gob
+        sheet.row_dimensions[row].height = ROWHEIGHT
+        row += 1
+        dekl_sälj = 0
+        dekl_sälj_belopp = 0;
+        for tx in transtable[valuta]:
+            v = tx.getAll()
+            sheet.cell(row=row, column=2).value = v[0] # Datum
+            sheet.cell(row=row, column=2).alignment = openpyxl.styles.Alignment(horizontal="left")
+            sheet.cell(row=row, column=3).value = v[1] # Var
+            sheet.cell(row=row, column=4).value = v[2] # Händelse
+            if v[3] > 0:
+                sheet.cell(row=row, column=5).value = v[3] # Debet+
+                sheet.cell(row=row, column=8).value = v[5] # Belopp+
+            else:
+                sheet.cell(row=row, column=6).value = v[3] # Kredit-
+                sheet.cell(row=row, column=9).value = v[5] # Belopp-
+                dekl_sälj += v[3]
+                dekl_sälj_belopp += v[5]
+            sheet.cell(row=row, column=7).value = v[4] # Valuta
+            sheet.cell(row=row, column=2).number_format = 'YYYY-MM-DD'
+            omkostnad, vinst, ränta = konto.update(tx.datum, tx.händelse, tx.antal, tx.belopp)
+            sheet.cell(row=row, column=11).value = konto.innehav
+            sheet.cell(row=row, column=12).value = konto.gob
+            if vinst != None:
+                sheet.cell(row=row, column=13).value = omkostnad
+                if vinst >= 0:
+                    col = 14
+                    tot_vinst += vinst
+                else:
+                    col = 15
+                    tot_förlust += vinst
+                sheet.cell(row=row, column=col).value = vinst
+            if ränta != None:
+                sheet.cell(row=row, column=16).value = ränta
+                tot_ränta += ränta
+            sheet.row_dimensions[row].height = ROWHEIGHT
+            row += 1
+        dsälj, dbelopp, domkostnad, dvinst = konto.get_dekl_vinst()
+        if dvinst > 0:
+            sheet.cell(row=row, column=3).value = "Deklaration vinst"
+            sheet.cell(row=row, column=6).value = dsälj
+            sheet.cell(row=row, column=9).value = dbelopp
+            sheet.cell(row=row, column=13).value = domkostnad
+            sheet.cell(row=row, column=14).value = dvinst
+            for i in [3, 6, 9, 13, 14]:
+                sheet.cell(row=row, column=i).font = boldfont
+                if i >= 9:
+                    sheet.cell(row=row, column=i).number_format = "0.00"
+            row += 1
+        dsälj, dbelopp, domkostnad, dvinst = konto.get_dekl_förlust()
+        if dvinst < 0:
+            sheet.cell(row=row, column=3).value = "Deklaration förlust"
+            sheet.cell(row=row, column=6).value = dsälj
+            sheet.cell(row=row, column=9).value = dbelopp
+            sheet.cell(row=row, column=13).value = domkostnad
+            sheet.cell(row=row, column=15).value = dvinst
+            for i in [3, 6, 9, 13, 14, 15]:
+                sheet.cell(row=row, column=i).font = boldfont
+                if i >= 9:
+                    sheet.cell(row=row, column=i).number_format = "0.00"
+            row += 1
+        row += 1
+    row += 1
+    sheet.cell(row=row, column=14).value = "TOTALT"
+    sheet.cell(row=row, column=14).font = boldfont
+    for c in range(3):
+        sheet.cell(row=row+1, column=14+c).value = ["Vinst", "Förlust", "Ränta"][c]
+        sheet.cell(row=row+1, column=14+c).font = boldfont
+        sheet.cell(row=row+2, column=14+c).value = [tot_vinst, tot_förlust, tot_ränta][c]
+    for i in range(3):
+        sheet.row_dimensions[row+i].height = ROWHEIGHT
+
+    row += 4
+    skatt = (tot_vinst + tot_ränta + tot_förlust*0.7)*0.3
+    sheet.cell(row=row, column=14).value = "SKATT"
+    sheet.cell(row=row, column=14).font = boldfont
+    sheet.cell(row=row+1, column=14).value = skatt
+
+    # Set fairly sensible column widths. Width is expressed as the
+    # number of monospace characters. Will do even for other fonts.
+    sheet.column_dimensions["A"].width = 14
+    sheet.column_dimensions["B"].width = 11
+    sheet.column_dimensions["C"].width = 20
+    sheet.column_dimensions["G"].width = 14
+    for c in "HIMNOP":
+        sheet.column_dimensions[c].width = 11
+        sheet.column_dimensions[c].number_format = "0.00"
+
+
+def referens_utbalans(sheet, balans):
+    konton = list(balans.values())
+    konton.sort()
+    boldfont = openpyxl.styles.Font(name='Arial',size=10,bold=True)
+    sheet["A1"].value = "Utgående balans"
+    sheet["A1"].font = boldfont
+    for i in range(3):
+        sheet.row_dimensions[i+1].height = ROWHEIGHT
+    h = ["Namn","Enhet","Innehav","GOB","","Omkostnad"]
+    for c in range(1,len(h)+1):
+        cell = sheet.cell(row=3, column=c)
+        cell.value = h[c-1]
+        cell.font = boldfont
+    row = 4
+    for k in konton:
+        for i,v in enumerate(k.getAll()):
+            sheet.cell(row=row, column=i+1).value = v
+        sheet.cell(row=row, column=6).value = k.innehav * k.gob
+        sheet.row_dimensions[row].height = ROWHEIGHT
+        row += 1
+    # Set fairly sensible column widths. Width is expressed as the
+    # number of monospace characters. Will do even for other fonts.
+    sheet.column_dimensions["A"].width = 20
+    sheet.column_dimensions["B"].width = 15
+    sheet.column_dimensions["F"].number_format = "0"
@@ -0,0 +1,128 @@
+import os, random, shutil, datetime
+import pytest, openpyxl
+import benchmark, kryptodeklaration as kd
+from conftest import ROT
+from referensrendering import referens_results, referens_utbalans
+
+def arbetsbok(filnamn):
+    wb = openpyxl.Workbook()
+    wb.active.title = kd.SHEET_TRAN
+    wb.create_sheet(kd.SHEET_INBAL)
+    wb.save(filnamn)
+
+def test_utdata_samma_fil_modifierar_indata(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    arbetsbok("bok.xlsx")
+    os.mkdir("under")
+    # Andra gången finns utflikarna redan och ska bekräftas
+    monkeypatch.setattr("builtins.input", lambda fråga: "j")
+    for utdata in ("bok.xlsx", os.path.join("under", "..", "bok.xlsx"),
+                   str(tmp_path / "bok.xlsx")):
+        k = kd.Kalkfil("bok.xlsx", utdata)
+        assert k.utfilename is None
+        k.save()
+    assert openpyxl.load_workbook("bok.xlsx").sheetnames == [
+        kd.SHEET_TRAN, kd.SHEET_INBAL, kd.SHEET_RESULTAT, kd.SHEET_UTBAL]
+
+def test_utdata_annan_fil(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    arbetsbok("bok.xlsx")
+    k = kd.Kalkfil("bok.xlsx", "ut.xlsx")
+    assert k.utfilename == "ut.xlsx"
+    k.save()
+    assert openpyxl.load_workbook("bok.xlsx").sheetnames == [kd.SHEET_TRAN, kd.SHEET_INBAL]
+    assert openpyxl.load_workbook("ut.xlsx").sheetnames == [kd.SHEET_RESULTAT, kd.SHEET_UTBAL]
+
+def referens(bok, utfil):
+    wb = openpyxl.load_workbook(bok)
+    balans = kd.read_inbalans(wb[kd.SHEET_INBAL])
+    transtable = kd.sort_check_transactions(balans, kd.read_transactions(wb[kd.SHEET_TRAN]))
+    ut = openpyxl.Workbook()
+    ut.active.title = kd.SHEET_RESULTAT
+    referens_results(ut.active, balans, transtable)
+    referens_utbalans(ut.create_sheet(kd.SHEET_UTBAL), balans)
+    ut.save(utfil)
+
+def rendera(bok, utfil=None):
+    k = kd.Kalkfil(bok, utfil)
+    balans = kd.read_inbalans(k.sheetI)
+    transtable = kd.sort_check_transactions(balans, kd.read_transactions(k.sheetT))
+    resultat = kd.beräkna(balans, transtable)
+    kd.output_results(k.sheetR, resultat)
+    kd.output_utbalans(k.sheetU, resultat.balans)
+    k.save()
+
+def celler(sheet):
+    """Värde, talformat, fetstil och justering för varje cell, samt
+    kolumnernas talformat. Ingen justering är detsamma som "general"."""
+    return ({(c.row, c.column): (c.value, c.number_format, c.font.b,
+                                 c.alignment.horizontal or "general")
+             for rad in sheet.iter_rows() for c in rad
+             if c.value is not None or c.has_style},
+            {k: d.number_format for k, d in sheet.column_dimensions.items()
+             if d.number_format != "General"})
+
+def jämför(facit, utfil):
+    f = openpyxl.load_workbook(facit)
+    u = openpyxl.load_workbook(utfil)
+    for flik in (kd.SHEET_RESULTAT, kd.SHEET_UTBAL):
+        fc, fk = celler(f[flik])
+        uc, uk = celler(u[flik])
+        assert fk == uk
+        assert fc.keys() == uc.keys()
+        for pos in fc:
+            assert fc[pos] == uc[pos], (flik, pos)
+
+@pytest.mark.parametrize("bok", ["bokföring-2021.xlsx", "syntetisk"])
+def test_rendering_som_originalet(bok, tmp_path, monkeypatch):
+    if bok == "syntetisk":
+        bok = str(tmp_path / "syntetisk.xlsx")
+        benchmark.generera_bok(bok, 1500, random.Random(10))
+    else:
+        bok = os.path.join(ROT, bok)
+    monkeypatch.chdir(tmp_path)
+    referens(bok, "facit.xlsx")
+
+    # Separat utdatafil (write_only) och i arbetsboken
+    rendera(bok, "ut.xlsx")
+    jämför("facit.xlsx", "ut.xlsx")
+    shutil.copy(bok, "kopia.xlsx")
+    monkeypatch.setattr("builtins.input", lambda fråga: "j")
+    rendera("kopia.xlsx")
+    jämför("facit.xlsx", "kopia.xlsx")
+
+def slumpbok(slump, valutor, n):
+    """Inbalans och n transaktioner, med sälj av hela innehavet ibland"""
+    balans = {v: kd.Konto(v.lower(), v, slump.choice([0.0, 50.0]), 10.0) for v in valutor}
+    innehav = {v: k.innehav for v, k in balans.items()}
+    translist = []
+    for i in range(n):
+        v = slump.choice(valutor)
+        händelse = slump.choice(["köp", "sälj", "ränta", "kapitalinkomst"])
+        if händelse == "sälj" and innehav[v] > 0:
+            antal = -innehav[v] if slump.random() < 0.2 else -innehav[v] * slump.uniform(0, 0.9)
+        else:
+            händelse = "köp" if händelse == "sälj" else händelse
+            antal = slump.uniform(0.01, 20)
+        innehav[v] += antal
+        datum = datetime.datetime(2021, 1, 1) + datetime.timedelta(hours=i)
+        translist.append(kd.Transaktion(datum, "test", händelse, antal, v,
+                                        round(slump.uniform(1, 5000), 2)))
+    return balans, translist
+
+def test_beräkna_som_konto_update():
+    slump = random.Random(11)
+    balans, translist = slumpbok(slump, ["A", "B", "C"], 3000)
+    facit = {v: kd.Konto(k.namn, k.enhet, k.innehav, k.gob) for v, k in balans.items()}
+    rader = {v: [] for v in facit}
+    for tx in translist:
+        k = facit[tx.valuta]
+        rader[tx.valuta].append(k.update(tx.datum, tx.händelse, tx.antal, tx.belopp)
+                                + (k.innehav, k.gob))
+    transtable = kd.sort_check_transactions(balans, translist)
+    for processer in (1, 2):
+        resultat = kd.beräkna({v: kd.Konto.from_state(k.get_state()) for v, k in balans.items()},
+                              transtable, processer=processer)
+        for vr in resultat.valutor:
+            assert vr.rader == rader[vr.valuta]
+            assert vr.konto.get_state() == facit[vr.valuta].get_state()
@@ -0,0 +1,49 @@
+import os, random, tempfile
+import process_gnosiswallet as gnosis
+from gnosislogg import RADER, skriv, swap
+
+def kör(loggfil, utfil):
+    gnosis.processfile(loggfil, utfil)
+    with open(utfil, encoding="utf-8") as f:
+        return f.read()
+
+def test_export_med_bom(kurser):
+    skriv("logg.csv", RADER)
+    skriv("bom.csv", RADER, encoding="utf-8-sig")
+    assert kör("bom.csv", "ut_bom.csv") == kör("logg.csv", "ut.csv")
+
+def test_osorterad_export_som_grupperad_i_minnet(kurser, monkeypatch, tmp_path, capsys):
+    slump = random.Random(24)
+    symboler = ["WXDAI", "GNO", "COW"]
+    rader = []
+    for nr in range(1, 41):
+        ut, in_ = slump.sample(symboler, 2)
+        for rad in swap(nr, slump.randint(1, 28), (ut, slump.randint(1, 999) / 8),
+                        (in_, slump.randint(1, 999) / 8)):
+            rad[1] = "100"      # ett block, så grupper() kontrollerar hasharna
+            rader.append(rad)
+    slump.shuffle(rader)
+
+    # Facit: raderna grupperade per transaktion i minnet, i den ordning
+    # transaktionerna först förekommer
+    grupperade = {}
+    for rad in rader:
+        grupperade.setdefault(rad[0], []).append(rad)
+    skriv("grupperad.csv", [rad for tx in grupperade.values() for rad in tx])
+    facit = kör("grupperad.csv", "facit.csv")
+    assert "sorterar om" not in capsys.readouterr().out
+
+    kataloger = set()
+    mkstemp = tempfile.mkstemp
+    def spion(*a, **kw):
+        fd, namn = mkstemp(*a, **kw)
+        kataloger.add(os.path.dirname(namn))
+        return fd, namn
+    monkeypatch.setattr(tempfile, "mkstemp", spion)
+    monkeypatch.setattr(gnosis, "SORTBLOCK", 7)
+    skriv("logg.csv", rader)
+    assert kör("logg.csv", "ut.csv") == facit
+    assert "sorterar om" in capsys.readouterr().out
+    assert kataloger == {tempfile.gettempdir()}
+    assert sorted(os.listdir(tmp_path)) == ["facit.csv", "grupperad.csv", "logg.csv",
+                                            "ut.csv", "valutor.json"]
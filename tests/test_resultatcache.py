@@ -0,0 +1,32 @@
+import resultatcache, process_gnosiswallet as gnosis
+from gnosislogg import RADER, skriv
+
+def kör(loggfil, utfil):
+    resultatcache.kör(gnosis.processfile, loggfil, utfil, gnosis,
+                      huvudrader=1, transaktionskolumn="Transaction Hash")
+    with open(utfil, encoding="utf-8") as f:
+        return f.read()
+
+def test_export_delad_mitt_i_transaktion(kurser, capsys):
+    skriv("hel.csv", RADER)
+    facit = kör("hel.csv", "facit.csv")
+
+    # Första exporten slutar efter första raden i transaktion 2
+    skriv("logg.csv", RADER[:3])
+    kör("logg.csv", "ut.csv")
+    skriv("logg.csv", RADER)
+    capsys.readouterr()
+    assert kör("logg.csv", "ut.csv") == facit
+    assert "kör om allt" in capsys.readouterr().out
+    assert ",sälj,-669.183698,WXDAI," in facit
+
+def test_export_delad_mellan_transaktioner(kurser, capsys):
+    skriv("hel.csv", RADER)
+    facit = kör("hel.csv", "facit.csv")
+
+    skriv("logg.csv", RADER[:4])
+    kör("logg.csv", "ut.csv")
+    skriv("logg.csv", RADER)
+    capsys.readouterr()
+    assert kör("logg.csv", "ut.csv") == facit
+    assert "nya bytes, lägger till" in capsys.readouterr().out
@@ -0,0 +1,204 @@
+import json, random, types, email.utils
+from collections import Counter
+import pytest
+import benchmark
+from datetime import date, datetime, timedelta, timezone
+
+def test_prefetch_fel_återställer_flush_batch(kurser, monkeypatch):
+    def http_get(url):
+        if "/timeseries" in url:
+            return benchmark.StubSvar({"error": "kvoten slut"})
+        return benchmark.stub_get(url)
+    monkeypatch.setattr(kurser, "http_get", http_get)
+    c = kurser.cache()
+    with pytest.raises(SystemExit):
+        kurser.prefetch([("usd", "2021-01-04"), ("usd", "2021-01-05")])
+    assert c.flush_batch == kurser.FLUSH_BATCH
+
+def test_import_json_fel_återställer_flush_batch(kurser):
+    with open("kurser.json", "w") as f:
+        json.dump({"usd": {"2021-01-04": 8.2}, "eur": [8.9]}, f)
+    c = kurser.cache()
+    with pytest.raises(Exception):
+        kurser.import_json("kurser.json")
+    assert c.flush_batch == kurser.FLUSH_BATCH
+    kurser.stäng_cache()
+    assert kurser.cache().get("usd", "2021-01-04") == 8.2
+
+
+class Klocka:
+    """Ersätter time i valuta: sleep() flyttar fram klockan och sparas"""
+    def __init__(self):
+        self.nu = 1000.0
+        self.väntat = []
+
+    def monotonic(self):
+        return self.nu
+
+    perf_counter = monotonic
+
+    def sleep(self, s):
+        self.väntat.append(s)
+        self.nu += s
+
+class Svar(benchmark.StubSvar):
+    def __init__(self, status, data=None, headers=None):
+        super().__init__(data)
+        self.status_code = status
+        self.headers = headers or {}
+
+@pytest.fixture
+def klocka(monkeypatch):
+    import valuta
+    k = Klocka()
+    monkeypatch.setattr(valuta, "time", types.SimpleNamespace(
+        monotonic=k.monotonic, perf_counter=k.perf_counter, sleep=k.sleep))
+    monkeypatch.setattr(valuta, "_buckets",
+                        {l: valuta.TokenBucket(1e9, 1e9) for l in valuta.KVOTER})
+    return k
+
+def svarslista(monkeypatch, *svar):
+    import valuta
+    anrop = []
+    def http_get(url):
+        anrop.append(url)
+        return svar[len(anrop) - 1]
+    monkeypatch.setattr(valuta, "http_get", http_get)
+    return anrop
+
+def test_get_json_429_retry_after_sekunder(klocka, monkeypatch):
+    import valuta
+    anrop = svarslista(monkeypatch, Svar(429, headers={"Retry-After": "3"}),
+                       Svar(200, {"prices": []}))
+    assert valuta.get_json("http://x", "coingecko") == {"prices": []}
+    assert len(anrop) == 2
+    assert klocka.väntat == [3.0]
+
+def test_get_json_429_retry_after_datum(klocka, monkeypatch):
+    import valuta
+    om_30_s = email.utils.format_datetime(
+        datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    svarslista(monkeypatch, Svar(429, headers={"Retry-After": om_30_s}),
+               Svar(200, {"ok": 1}))
+    assert valuta.get_json("http://x", "coingecko") == {"ok": 1}
+    assert len(klocka.väntat) == 1 and 28 < klocka.väntat[0] <= 30
+
+def test_get_json_429_utan_retry_after(klocka, monkeypatch):
+    import valuta
+    anrop = svarslista(monkeypatch, Svar(429), Svar(429), Svar(200, {"ok": 1}))
+    assert valuta.get_json("http://x", "currencybeacon") == {"ok": 1}
+    assert len(anrop) == 3
+    assert klocka.väntat == [1, 2]
+
+def test_retry_after():
+    import valuta
+    assert valuta.retry_after("7", 1) == 7.0
+    assert valuta.retry_after(None, 4) == 4
+    assert valuta.retry_after("snart", 4) == 4
+    assert valuta.retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 4) == 0.0
+
+def test_tokenbucket_slut(klocka):
+    import valuta
+    b = valuta.TokenBucket(2, 3)
+    for _ in range(3):
+        b.take()
+    assert klocka.väntat == []
+    b.take()
+    assert klocka.väntat == [0.5]
+    klocka.nu += 1.0        # två nya polletter
+    b.take()
+    b.take()
+    assert klocka.väntat == [0.5]
+    b.take()
+    assert klocka.väntat == [0.5, 0.5]
+
+def test_get_json_väntar_på_pollett(klocka, monkeypatch):
+    import valuta
+    monkeypatch.setitem(valuta._buckets, "coingecko", valuta.TokenBucket(1, 1))
+    anrop = svarslista(monkeypatch, Svar(200, {"a": 1}), Svar(200, {"b": 2}))
+    assert valuta.get_json("http://x", "coingecko") == {"a": 1}
+    assert valuta.get_json("http://y", "coingecko") == {"b": 2}
+    assert anrop == ["http://x", "http://y"]
+    assert klocka.väntat == [1.0]
+
+
+ARKIVVALUTOR = ["usd", "bitcoin", "ethereum", "gnosis", "kr€dit"]
+
+def slumpdatum(slump, första="2008-12-01", sista="2021-12-31"):
+    """Från före EPOK, så att även arkivets kopior (inte vyer) testas"""
+    dag = slump.randint(date.fromisoformat(första).toordinal(),
+                        date.fromisoformat(sista).toordinal())
+    return date.fromordinal(dag).isoformat()
+
+def kontrollera(c, facit, slump):
+    for v, kurser in facit.items():
+        for d in slump.sample(sorted(kurser), min(len(kurser), 20)):
+            assert c.get(v, d) == kurser[d]
+        d = slumpdatum(slump)
+        assert c.get(v, d) == kurser.get(d)
+    assert sorted(c.items()) == sorted((v, d, k) for v, kurser in facit.items()
+                                       for d, k in kurser.items())
+
+def test_arkiv_slumpvis_put_flush_öppna(tmp_path, monkeypatch):
+    import valuta
+    slump = random.Random(23)
+    fil = str(tmp_path / "kurser.kurs")
+    vägar = Counter()
+    skriv_om = valuta.ArkivKurscache._skriv_om
+    def spion(self):
+        vägar["skriv om"] += 1
+        skriv_om(self)
+    monkeypatch.setattr(valuta.ArkivKurscache, "_skriv_om", spion)
+
+    facit = {}
+    c = valuta.ArkivKurscache(fil)
+    c.flush_batch = None
+    for _ in range(300):
+        for _ in range(slump.randint(1, 20)):
+            v = slump.choice(ARKIVVALUTOR)
+            if v in facit and slump.random() < 0.7:
+                # Inom det som redan finns för valutan
+                d = slumpdatum(slump, min(facit[v]), max(facit[v]))
+            else:
+                d = slumpdatum(slump)
+            kurs = slump.randint(1, 10**6) / 64
+            if slump.random() < 0.5:
+                c.put(v, d, kurs)
+            else:
+                c.put_many(v, {d: kurs})
+            facit.setdefault(v, {})[d] = kurs
+        före = (vägar["skriv om"], {v: post[2] for v, post in c.index.items()})
+        c.flush()
+        if vägar["skriv om"] == före[0]:
+            flyttade = any(c.index[v][2] != offset for v, offset in före[1].items())
+            ny = set(c.index) != set(före[1])
+            vägar["tillägg" if flyttade or ny else "på plats"] += 1
+        if slump.random() < 0.2:
+            c.close()
+            c = valuta.ArkivKurscache(fil)
+            c.flush_batch = None
+        kontrollera(c, facit, slump)
+    c.close()
+    kontrollera(valuta.ArkivKurscache(fil), facit, slump)
+    assert min(vägar[v] for v in ("på plats", "tillägg", "skriv om")) > 0, vägar
+
+def test_arkiv_import_export(tmp_path, monkeypatch):
+    import valuta
+    monkeypatch.chdir(tmp_path)
+    slump = random.Random(5)
+    facit = {v: {slumpdatum(slump): slump.randint(1, 10**9) / 1000 for _ in range(200)}
+             for v in ARKIVVALUTOR}
+    valuta.save(facit, "start.json")
+    föregående = "start.json"
+    for i, cachefil in enumerate(["a.kurs", "b.sqlite", "c.json", "d.kurs"]):
+        valuta.import_json(föregående, cachefil)
+        föregående = "export%d.json" % i
+        valuta.export_json(föregående, cachefil)
+        assert valuta.load(föregående) == facit
+
+def test_arkiv_annan_version(tmp_path):
+    import valuta
+    fil = tmp_path / "gammal.kurs"
+    fil.write_bytes(valuta._ARKIV_HUVUD.pack(valuta.ARKIV_MAGI, valuta.ARKIV_VERSION + 1, 0, 0, 0))
+    with pytest.raises(SystemExit):
+        valuta.ArkivKurscache(str(fil))
@@ -0,0 +1,193 @@
+#
+# Tidtagning per fas för kryptodeklaration.py och pipeline.py
+#
+# Faserna markeras i koden med
+#
+#   with tidtagning.fas("read_transactions") as f:
+#       translist = read_transactions(sheet)
+#       f.rader = len(translist)
+#
+# Utan start() gör fas() ingenting. Efter start() sparas väggtid, antal rader,
+# rader/s och högsta RSS per fas, och med tracemalloc även högsta allokerade
+# minne under fasen. I program som använder valuta (pipeline.py och
+# processerna) mäts valuta.lookup() uppdelat på cacheträffar och missar, och
+# valuta.get_json() räknar tiden i nätverksanrop. kryptodeklaration.py slår
+# inte upp några kurser och visar bara faserna.
+#
+# slut() skriver en sammanfattning, och valfritt json, en cProfile-fil
+# (läses med python -m pstats FIL) och de största allokeringarna enligt
+# tracemalloc.
+
+import sys, time, json
+
+class Fas:
+    def __init__(self, namn):
+        self.namn = namn
+        self.rader = None
+        self.tid = 0.0
+        self.rss = None
+        self.minne = None
+
+    def __enter__(self):
+        if _aktiv:
+            if _aktiv.tracemalloc:
+                import tracemalloc
+                tracemalloc.reset_peak()
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if _aktiv:
+            self.tid = time.perf_counter() - self.t0
+            self.rss = max_rss_mb()
+            if _aktiv.tracemalloc:
+                import tracemalloc
+                self.minne = tracemalloc.get_traced_memory()[1] / (1 << 20)
+            _aktiv.faser.append(self)
+
+    def som_dict(self):
+        return {"fas": self.namn, "tid": self.tid, "rader": self.rader,
+                "rader_per_s": self.rader / self.tid if self.rader and self.tid > 0 else None,
+                "max_rss_mb": self.rss, "tracemalloc_topp_mb": self.minne}
+
+class Mätning:
+    def __init__(self, json_fil=None, profil=None, minne=None):
+        self.json_fil = json_fil
+        self.profil = profil
+        self.minne = minne
+        self.tracemalloc = minne is not None
+        self.faser = []
+        self.start = time.perf_counter()
+        self.lookup = {"träffar": 0, "träff_tid": 0.0, "missar": 0, "miss_tid": 0.0}
+        self.nätverk = {"anrop": 0, "tid": 0.0}   # från andra processer
+        self.profiler = None
+
+_aktiv = None
+
+def fas(namn):
+    """Kontext för en fas, se modulens beskrivning"""
+    return Fas(namn)
+
+def aktiv():
+    return _aktiv is not None
+
+def max_rss_mb():
+    """Högsta RSS hittills i MB, None där resource saknas (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB på Linux, bytes på macOS
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+def start(json_fil=None, profil=None, minne=None):
+    """Slå på tidtagningen. profil: fil för cProfile, minne: fil för
+    tracemalloc-statistik (slår även på minnesmätning per fas)."""
+    global _aktiv
+    _aktiv = Mätning(json_fil, profil, minne)
+    if minne is not None:
+        import tracemalloc
+        tracemalloc.start()
+    if profil is not None:
+        import cProfile
+        _aktiv.profiler = cProfile.Profile()
+        _aktiv.profiler.enable()
+    instrumentera_valuta()
+
+def lägg_till_argument(parser):
+    """Flaggorna --tidtagning, --profil och --minnesprofil för argparse"""
+    parser.add_argument("--tidtagning", nargs="?", const="", metavar="JSON",
+                        help="skriv tid, rader/s och minne per fas, och som json till JSON om angiven")
+    parser.add_argument("--profil", metavar="FIL",
+                        help="kör med cProfile och spara statistiken i FIL (slår på --tidtagning)")
+    parser.add_argument("--minnesprofil", metavar="FIL",
+                        help="mät minne per fas med tracemalloc och skriv största allokeringarna "
+                             "till FIL (slår på --tidtagning)")
+
+def start_från_argument(args):
+    """start() om någon av flaggorna från lägg_till_argument() är angiven"""
+    if args.tidtagning is not None or args.profil or args.minnesprofil:
+        start(args.tidtagning or None, args.profil, args.minnesprofil)
+
+def instrumentera_valuta():
+    """Mät tiden i valuta.lookup() uppdelat på cacheträffar och missar (missar
+    innehåller nätverksanropen). Gör inget om valuta inte används."""
+    valuta = sys.modules.get("valuta")
+    if valuta is None or getattr(valuta.lookup, "tidtagen", False):
+        return
+    original = valuta.lookup
+    def lookup(datum, v):
+        c = valuta.cache()
+        före = c.träffar
+        t0 = time.perf_counter()
+        kurs = original(datum, v)
+        dt = time.perf_counter() - t0
+        stat = _aktiv.lookup if _aktiv else None
+        if stat is not None:
+            if c.träffar > före:
+                stat["träffar"] += 1
+                stat["träff_tid"] += dt
+            else:
+                stat["missar"] += 1
+                stat["miss_tid"] += dt
+        return kurs
+    lookup.tidtagen = True
+    valuta.lookup = lookup
+
+def valuta_statistik():
+    """lookup- och nätverkstider från valuta, None om valuta inte används"""
+    valuta = sys.modules.get("valuta")
+    if valuta is None:
+        return None
+    s = dict(_aktiv.lookup) if _aktiv else {}
+    andra = _aktiv.nätverk if _aktiv else {"anrop": 0, "tid": 0.0}
+    s["nätverksanrop"] = valuta.nätverk["anrop"] + andra["anrop"]
+    s["nätverkstid"] = valuta.nätverk["tid"] + andra["tid"]
+    return s
+
+def lägg_till_valuta(stat):
+    """Lägg till valuta_statistik() från en annan process (t ex pipeline.py)"""
+    if _aktiv and stat:
+        for k in _aktiv.lookup:
+            _aktiv.lookup[k] += stat[k]
+        _aktiv.nätverk["anrop"] += stat["nätverksanrop"]
+        _aktiv.nätverk["tid"] += stat["nätverkstid"]
+
+def slut():
+    """Skriv sammanfattning och filer, och stäng av tidtagningen"""
+    global _aktiv
+    if not _aktiv:
+        return
+    m = _aktiv
+    if m.profiler:
+        m.profiler.disable()
+        m.profiler.dump_stats(m.profil)
+    total = time.perf_counter() - m.start
+    v = valuta_statistik()
+
+    print("%-28s %9s %10s %11s %8s" % ("Fas", "Tid s", "Rader", "Rader/s", "RSS MB"))
+    for f in m.faser:
+        d = f.som_dict()
+        print("%-28s %9.3f %10s %11s %8s" % (
+            f.namn, f.tid, "" if f.rader is None else f.rader,
+            "" if d["rader_per_s"] is None else "%.0f" % d["rader_per_s"],
+            "" if f.rss is None else "%.0f" % f.rss)
+            + ("  (tracemalloc %.0f MB)" % f.minne if f.minne is not None else ""))
+    print("%-28s %9.3f" % ("Totalt", total))
+    if v and (v["träffar"] or v["missar"] or v["nätverksanrop"]):
+        print("Kursuppslag: %d träffar %.3f s, %d missar %.3f s, %d nätverksanrop %.3f s" % (
+            v["träffar"], v["träff_tid"], v["missar"], v["miss_tid"],
+            v["nätverksanrop"], v["nätverkstid"]))
+
+    if m.minne is not None:
+        import tracemalloc
+        with open(m.minne, "w", encoding="utf-8") as f:
+            for s in tracemalloc.take_snapshot().statistics("lineno")[:50]:
+                print(s, file=f)
+        tracemalloc.stop()
+    if m.json_fil:
+        with open(m.json_fil, "w", encoding="utf-8") as f:
+            json.dump({"faser": [f.som_dict() for f in m.faser], "total_tid": total,
+                       "valuta": v}, f, ensure_ascii=False, indent=1)
+    _aktiv = None
@@ -5,11 +5,17 @@
 # För USD/EUR: exchangerate.host
 # För krypto: coingecko
 
-import sys, json, requests
-from datetime import datetime
+import sys, os, json, time, mmap, struct, atexit, threading, sqlite3, requests
+import email.utils
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta, timezone
 from valuta_apikeys import APIKEY_CURRENCYBEACON, APIKEY_COINGECKO
 
 # Cachefilen ser t ex
+# Filändelsen väljer format: .json (standard), .sqlite/.db (SQLite, kan
+# delas av flera processer samtidigt) eller .kurs (binärt arkiv som läses
+# med mmap, se ArkivKurscache)
 CACHEFILE = "valutor.json"
 
 # https://api.coingecko.com/api/v3/coins/list
@@ -17,15 +23,56 @@ COINLIST = "coinlist.json"   # list.json från coingecko, symbol -> id
 
 FIAT = ["usd", "eur", "gbp"]
 
+# API-adresser, kan pekas om mot t ex en lokal testserver
+CURRENCYBEACON_URL = "http://api.currencybeacon.com/v1/"
+COINGECKO_URL = "https://api.coingecko.com/api/v3/"
+
+# Alla anrop går genom en gemensam session så att uppkopplingar återanvänds
+ARBETARE = 4    # antal samtidiga hämtningar i prefetch()
+_session = requests.Session()
+_session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=ARBETARE))
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=ARBETARE))
+
+# HTTP-backend för alla anrop: funktion url -> svar med .json(), .status_code
+# och .headers. Kan bytas ut, t ex mot en stub.
+http_get = _session.get
+
+# Största antal dagar per intervallanrop i prefetch()
+MAX_INTERVALL = 365
+
+# Hastighetsbegränsning per leverantör: (anrop per sekund, största skur).
+# Coingecko demo tillåter 30 anrop/minut. Skuren måste vara 1 där, annars
+# ryms både skuren och påfyllningen (30 + 30) i första minuten.
+KVOTER = {"currencybeacon": (10, 10),
+          "coingecko": (0.5, 1)}
+
+# Antal försök vid "429 Too Many Requests" innan vi ger upp
+MAX_FÖRSÖK = 5
+
+# Antal nya kurser som samlas innan cachefilen skrivs om. Resten skrivs vid
+# programslut.
+FLUSH_BATCH = 100
+
+# Kurser som lookup() har returnerat, {(valuta, datum): kurs}, när de spåras
+# (se spåra_kurser). Används av resultatcache.py.
+använda_kurser = None
+
 def main():
     if len(sys.argv) < 2:
         print('''Användning:
  - ange datum (ex 2021-01-01 och fiatvaluta (usd, eur) som argument
  - ange datum och kryptovaluta (coinid, t ex bitcoin) som argument
  - ange enbart kryptosymbol (t ex btc) för att söka coinid
+ - ange --import eller --export och en json-fil för att flytta kurser mellan
+   json-filen och cachen (CACHEFILE, eller cachefilen som anges sist, t ex
+   valutor.kurs för att skapa ett binärt arkiv)
 ''')
         exit(1)
-    if len(sys.argv) == 2:
+    if sys.argv[1] == "--import" and len(sys.argv) in (3, 4):
+        import_json(*sys.argv[2:])
+    elif sys.argv[1] == "--export" and len(sys.argv) in (3, 4):
+        export_json(*sys.argv[2:])
+    elif len(sys.argv) == 2:
         valutasymbol = sys.argv[1]
         symbol_to_coinid(valutasymbol)
     else:
@@ -42,23 +89,41 @@ def translate(symbol):
     ''' Returnera första matchande CoinGecko coin-id för en tokensymbol (ex "gno" -> "gnosis").
         Returnerar symbol oförändrad om ingen match hittas.
     '''
-    with open(COINLIST) as f:
-        cl = json.load(f)
-    for coin in cl:
-        if coin["symbol"] == symbol.lower():
-            return coin["id"]
-    return symbol.lower()
+    ids = coinindex().symbol.get(symbol.lower())
+    return ids[0] if ids else symbol.lower()
 
 def symbol_to_coinid(valutasymbol):
     ''' Lista matchande coinid baserat på list.json från coingecko.
         Ex: [{"id":"01coin","symbol":"zoc","name":"01coin"},...]
     '''
-    with open(COINLIST) as f:
-        cl = json.load(f)
-    for coin in cl:
-        if coin["symbol"] == valutasymbol:
-            print(coin["id"])
-    
+    for coinid in coinindex().symbol.get(valutasymbol, []):
+        print(coinid)
+
+class Coinindex:
+    """Uppslagstabeller byggda från COINLIST:
+         symbol: symbol -> lista med coin-id i filens ordning
+         namn:   namn -> första coin-id med det namnet
+         id:     coin-id -> posten i listan"""
+    def __init__(self, filnamn):
+        with open(filnamn) as f:
+            cl = json.load(f)
+        self.symbol = {}
+        self.namn = {}
+        self.id = {}
+        for coin in cl:
+            self.symbol.setdefault(coin["symbol"], []).append(coin["id"])
+            self.namn.setdefault(coin["name"], coin["id"])
+            self.id[coin["id"]] = coin
+
+_coinindex = None
+
+def coinindex():
+    """Returnera processens Coinindex, COINLIST läses bara en gång"""
+    global _coinindex
+    if _coinindex is None:
+        _coinindex = Coinindex(COINLIST)
+    return _coinindex
+
 def lookup(datum, valuta):
     ''' Returnera kursen för datumet och valutan. Hämta kurs från API vid behov.
         Exempel på cachefilens utseende och valutor-dicten:
@@ -66,13 +131,13 @@ def lookup(datum, valuta):
    "bitcoin": {"2022-01-02": 47816.07767640849, "2022-01-03": 47387.212167697246}}
         OBS: fiat ger SEK tillbaks, krypto ger USD tillbaks!
     '''
-    valutor = load()
-    if not valuta in valutor:
-        valutor[valuta] = {}
-        
-    if datum in valutor[valuta]:
-        return valutor[valuta][datum]
-    
+    c = cache()
+    kurs = c.get(valuta, datum)
+    if kurs is not None:
+        if använda_kurser is not None:
+            använda_kurser[(valuta, datum)] = kurs
+        return kurs
+
     nu = datetime.now().date()
     dt = datetime.fromisoformat(datum).date()
     if dt > nu:
@@ -86,18 +151,42 @@ def lookup(datum, valuta):
         kurs = fetch_crypto(datum, valuta, nu == dt)  # kurs i USD
         
     # Spara enbart om historiskt datum, ej dagens datum
-    if datetime.fromisoformat(datum).date() < nu:
-        valutor[valuta][datum] = kurs
-        save(valutor)
+    if dt < nu:
+        c.put(valuta, datum, kurs)
 
+    if använda_kurser is not None:
+        använda_kurser[(valuta, datum)] = kurs
     return kurs
 
+def lookup_many(datumlista, valuta):
+    """ Som lookup() men för en hel lista datum (ISO-strängar) på en gång.
+        Saknade kurser hämtas först med prefetch(), sedan slås alla upp i
+        valutans kurstabell i ett anrop. Returnerar en lista med kurser.
+    """
+    datumlista = list(datumlista)
+    prefetch((valuta, d) for d in set(datumlista))
+    kurser = cache().get_many(valuta, datumlista)
+    for i, kurs in enumerate(kurser):
+        if kurs is None:
+            # Dagens datum eller kurs som inte gick att hämta i intervall
+            kurser[i] = lookup(datumlista[i], valuta)
+    if använda_kurser is not None:
+        använda_kurser.update(((valuta, d), k) for d, k in zip(datumlista, kurser))
+    return kurser
+
+def spåra_kurser():
+    """Börja spara alla kurser som lookup() returnerar. Returnerar dicten
+    {(valuta, datum): kurs} som fylls på."""
+    global använda_kurser
+    använda_kurser = {}
+    return använda_kurser
+
 # Ny med currencybeacon.com istället!
 # Supported currencies: https://currencybeacon.com/supported-currencies
 
 def fetch_fiat(datum, valuta, isToday):
     ''' Returnera kurs i SEK. Exempel: datum="2021-01-01", valuta="usd" '''
-    url = "http://api.currencybeacon.com/v1/"
+    url = CURRENCYBEACON_URL
     url2 = f"?base={valuta.upper()}&symbols=SEK&api_key={APIKEY_CURRENCYBEACON}"
     if isToday:
         url += "latest" + url2
@@ -105,8 +194,7 @@ def fetch_fiat(datum, valuta, isToday):
     else:
         url += "historical" + url2 + f"&date={datum}"
         print("Hämtar historisk kurs från currencybeacon!")
-    response = requests.get(url)
-    data = response.json()
+    data = get_json(url, "currencybeacon")
     if not "response" in data:
         print(data)
         sys.exit(1)
@@ -121,7 +209,7 @@ def fetch_fiat_exchangeratehost(datum, valuta, isToday):
     else:
         url += f"&date={datum}"
         print("Hämtar historisk kurs från exchangerate.host!")
-    response = requests.get(url)
+    response = http_get(url)
     data = response.json()
     if "error" in data:
         print(data["error"])
@@ -133,34 +221,716 @@ def fetch_crypto(datum, coinid, isToday):
     temp = datum.split("-")
     rev_date = f"{temp[2]}-{temp[1]}-{temp[0]}"
     if isToday:
-        url = f"https://api.coingecko.com/api/v3/simple/price?ids={coinid}&vs_currencies=usd&x_cg_demo_api_key={APIKEY_COINGECKO}"
+        url = f"{COINGECKO_URL}simple/price?ids={coinid}&vs_currencies=usd&x_cg_demo_api_key={APIKEY_COINGECKO}"
         print("Hämtar senaste kurs från coingecko.com!")
-        response = requests.get(url)
-        data = response.json()
+        data = get_json(url, "coingecko")
         return data[coinid]["usd"]
     else:
-        url = f"https://api.coingecko.com/api/v3/coins/{coinid}/history?date={rev_date}&x_cg_demo_api_key={APIKEY_COINGECKO}"
+        url = f"{COINGECKO_URL}coins/{coinid}/history?date={rev_date}&x_cg_demo_api_key={APIKEY_COINGECKO}"
         print("Hämtar historisk kurs från coingecko.com!")
-        response = requests.get(url)
-        data = response.json()
+        data = get_json(url, "coingecko")
         if not 'market_data' in data:
             print("Unknown error:", data)
         return data['market_data']['current_price']["usd"]
 
-def load():
+# Dag 0 i kurstabellerna, bitcoins första block. Kurser före detta datum
+# hålls inte i tabellerna utan slås upp i cachen.
+EPOK = date(2009, 1, 3).toordinal()
+SAKNAS = float("nan")
+
+_dagindex = {}  # ISO-datum -> dag från EPOK, delas av alla tabeller
+
+def dagindex(datum):
+    i = _dagindex.get(datum)
+    if i is None:
+        i = _dagindex[datum] = date.fromisoformat(datum).toordinal() - EPOK
+    return i
+
+class Kurstabell:
+    """En valutas kurser i en array('d') med en plats per dag från EPOK,
+    NaN för dagar utan kurs. Ett uppslag är ett index i arrayen.
+    kurser kan också vara en läsbar vy direkt in i ett kursarkiv
+    (ArkivKurscache), den kopieras till en array vid första put()."""
+    def __init__(self, kurser=()):
+        self.kurser = array('d')
+        for datum, kurs in kurser:
+            self.put(datum, kurs)
+
+    def put(self, datum, kurs):
+        i = dagindex(datum)
+        if i < 0:
+            return
+        if type(self.kurser) is not array:
+            kurser = array('d')
+            kurser.frombytes(self.kurser.tobytes())
+            self.kurser = kurser
+        if i >= len(self.kurser):
+            self.kurser.extend([SAKNAS] * (i + 1 - len(self.kurser)))
+        self.kurser[i] = kurs
+
+    def get(self, datum):
+        """Kursen för datumet eller None"""
+        i = _dagindex.get(datum)
+        if i is None:
+            i = dagindex(datum)
+        if 0 <= i < len(self.kurser):
+            kurs = self.kurser[i]
+            if kurs == kurs:    # inte NaN
+                return kurs
+        return None
+
+    def get_many(self, datumlista):
+        """Kurserna för alla datum i listan, None där kurs saknas"""
+        index = list(map(_dagindex.get, datumlista))
+        if None in index:
+            index = list(map(dagindex, datumlista))
+        if not index:
+            return []
+        kurser = self.kurser
+        if min(index) < 0 or max(index) >= len(kurser):
+            return [self.get(d) for d in datumlista]
+        return [k if k == k else None for k in map(kurser.__getitem__, index)]
+
+class Kurscache:
+    """Alla hämtade kurser i minnet, delas av alla uppslag i processen.
+    Cachefilen läses in en gång. Nya kurser markeras som ändrade och skrivs
+    till disk i omgångar om FLUSH_BATCH, samt vid programslut.
+    Uppslagen går via en Kurstabell per valuta som fylls från cachen första
+    gången valutan används, cachen frågas bara när tabellen saknar kursen."""
+    def __init__(self, filnamn):
+        self.filnamn = filnamn
+        self.valutor = None     # läses in vid första uppslaget
+        self.tabeller = {}      # valuta -> Kurstabell
+        self.ändrade = 0        # antal nya kurser sedan senaste flush
+        self.flush_batch = FLUSH_BATCH  # None: skriv bara vid flush()
+        self.träffar = 0
+        self.missar = 0
+
+    def _valutor(self):
+        if self.valutor is None:
+            self.valutor = load(self.filnamn)
+        return self.valutor
+
+    def _get(self, valuta, datum):
+        return self._valutor().get(valuta, {}).get(datum)
+
+    def _put(self, valuta, datum, kurs):
+        self._valutor().setdefault(valuta, {})[datum] = kurs
+
+    def _kurser(self, valuta):
+        """Alla kurser för valutan som (datum, kurs)"""
+        return self._valutor().get(valuta, {}).items()
+
+    def _skriv(self):
+        save(self.valutor, self.filnamn)
+
+    def tabell(self, valuta):
+        """Kurstabellen för valutan, skapas från cachen första gången"""
+        t = self.tabeller.get(valuta)
+        if t is None:
+            t = self.tabeller[valuta] = Kurstabell(self._kurser(valuta))
+        return t
+
+    def _get_tabell(self, valuta, datum):
+        t = self.tabeller.get(valuta)
+        if t is None:
+            t = self.tabell(valuta)
+        kurs = t.get(datum)
+        if kurs is None:
+            # Kan ha lagts till av en annan process (SQLite) eller ligga före EPOK
+            kurs = self._get(valuta, datum)
+            if kurs is not None:
+                t.put(datum, kurs)
+        return kurs
+
+    def get(self, valuta, datum):
+        """Returnera cachad kurs eller None"""
+        t = self.tabeller.get(valuta)
+        kurs = t.get(datum) if t is not None else None
+        if kurs is None:
+            kurs = self._get_tabell(valuta, datum)
+            if kurs is None:
+                self.missar += 1
+                return None
+        self.träffar += 1
+        return kurs
+
+    def get_many(self, valuta, datumlista):
+        """Returnera cachade kurser för alla datum, None där kurs saknas"""
+        kurser = self.tabell(valuta).get_many(datumlista)
+        for i, kurs in enumerate(kurser):
+            if kurs is None:
+                kurser[i] = self._get_tabell(valuta, datumlista[i])
+        saknas = kurser.count(None)
+        self.missar += saknas
+        self.träffar += len(kurser) - saknas
+        return kurser
+
+    def peek(self, valuta, datum):
+        """Som get() men räknas inte som träff eller miss"""
+        return self._get_tabell(valuta, datum)
+
+    def has(self, valuta, datum):
+        """Finns kursen i cachen? Räknas inte som träff eller miss."""
+        return self.peek(valuta, datum) is not None
+
+    def _put_many(self, valuta, kurser):
+        for datum, kurs in kurser.items():
+            self._put(valuta, datum, kurs)
+
+    def put(self, valuta, datum, kurs):
+        self._put(valuta, datum, kurs)
+        self.tabell(valuta).put(datum, kurs)
+        self.ändrade += 1
+        if self.flush_batch and self.ändrade >= self.flush_batch:
+            self.flush()
+
+    def put_many(self, valuta, kurser):
+        """Spara alla kurser för valutan, kurser är {datum: kurs}"""
+        if not kurser:
+            return
+        self._put_many(valuta, kurser)
+        t = self.tabell(valuta)
+        for datum, kurs in kurser.items():
+            t.put(datum, kurs)
+        self.ändrade += len(kurser)
+        if self.flush_batch and self.ändrade >= self.flush_batch:
+            self.flush()
+
+    def flush(self):
+        """Skriv cachefilen om något har ändrats"""
+        if self.ändrade > 0:
+            self._skriv()
+            self.ändrade = 0
+
+    def items(self):
+        """Alla kurser som (valuta, datum, kurs)"""
+        for valuta, kurser in self._valutor().items():
+            for datum, kurs in kurser.items():
+                yield valuta, datum, kurs
+
+    def statistik(self):
+        return {"träffar": self.träffar, "missar": self.missar}
+
+    def close(self):
+        self.flush()
+
+class SqliteKurscache(Kurscache):
+    """Kurscache i en SQLite-databas med (valuta, datum) som primärnyckel.
+    Varje uppslag och ny kurs är ett indexerat anrop, filen skrivs aldrig om
+    i sin helhet. WAL-läge gör att flera processer kan dela databasen.
+    Varje put() och put_many() är en egen kort transaktion som committas
+    direkt, så att skrivlåset aldrig hålls medan kurser hämtas över nätet
+    och andra processer ser de nya kurserna med en gång."""
+    def __init__(self, filnamn):
+        super().__init__(filnamn)
+        self.db = sqlite3.connect(filnamn, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # Med WAL räcker NORMAL för att en commit aldrig ska ge en trasig
+        # databas, och commit blir billig
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS kurser (
+                               valuta TEXT NOT NULL,
+                               datum TEXT NOT NULL,
+                               kurs REAL NOT NULL,
+                               PRIMARY KEY (valuta, datum)) WITHOUT ROWID""")
+        self.db.commit()
+
+    def _get(self, valuta, datum):
+        rad = self.db.execute("SELECT kurs FROM kurser WHERE valuta = ? AND datum = ?",
+                              (valuta, datum)).fetchone()
+        return rad[0] if rad else None
+
+    def _put(self, valuta, datum, kurs):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO kurser VALUES (?, ?, ?)",
+                            (valuta, datum, kurs))
+
+    def _put_many(self, valuta, kurser):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO kurser VALUES (?, ?, ?)",
+                                ((valuta, datum, kurs) for datum, kurs in kurser.items()))
+
+    def _kurser(self, valuta):
+        return self.db.execute("SELECT datum, kurs FROM kurser WHERE valuta = ?", (valuta,))
+
+    def _skriv(self):
+        self.db.commit()
+
+    def close(self):
+        super().close()
+        self.db.close()
+
+    def items(self):
+        return self.db.execute("SELECT valuta, datum, kurs FROM kurser ORDER BY valuta, datum")
+
+ARKIV_MAGI = b"KURS"
+ARKIV_VERSION = 1
+_ARKIV_HUVUD = struct.Struct("<4sHHIQ") # magi, version, reserverad, antal valutor, indexets offset
+_ARKIV_NAMN = struct.Struct("<H")       # namnets längd i bytes, följs av namnet (utf-8)
+_ARKIV_POST = struct.Struct("<iIQ")     # första dag från EPOK, antal dagar, offset
+_INGA = {}
+
+class ArkivKurscache(Kurscache):
+    """Kurscache i ett binärt arkiv (.kurs) som läses med mmap.
+    Filen börjar med ett huvud som pekar ut indexet sist i filen. Indexet
+    har varje valutas namn, första dag (från EPOK, kan vara negativ), antal
+    dagar och var i filen kurserna ligger. Kurserna är float64 (little
+    endian), en per dag och NaN där kurs saknas. Bara indexet läses vid
+    start, en valutas kurstabell är en vy direkt in i filen. Startkostnaden
+    beror därför inte på hur många år och valutor arkivet innehåller.
+    Nya kurser samlas i minnet. Vid flush skrivs de på plats om dagarna
+    ryms i valutans avsnitt, annars läggs ett nytt avsnitt för valutan sist
+    i filen. Därefter skrivs ett nytt index sist och till sist huvudet, som
+    pekar ut indexet. Gamla avsnitt och index blir skräp, och först när
+    skräpet är mer än halva filen skrivs hela filen om."""
+    def __init__(self, filnamn):
+        super().__init__(filnamn)
+        self.nya = {}       # valuta -> {datum: kurs} som inte skrivits ännu
+        self.index = {}     # valuta -> (start, antal, offset)
+        self.f = None
+        self.mm = None
+        self.gamla = []     # mmaps från före senaste flush, stängs med filen
+        self.vyer = []      # alla memoryviews in i mm, släpps innan den stängs
+        self._öppna()
+
+    def _öppna(self):
+        try:
+            self.f = open(self.filnamn, "rb")
+        except FileNotFoundError:
+            print("Varning: hittar ej", self.filnamn, "- skapar ny!")
+            return
+        if os.fstat(self.f.fileno()).st_size == 0:
+            return
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magi, version, _, antal, pos = _ARKIV_HUVUD.unpack_from(self.mm, 0)
+        if magi != ARKIV_MAGI or version != ARKIV_VERSION:
+            sys.exit("Error: " + self.filnamn + " är inte ett kursarkiv, version "
+                     + str(ARKIV_VERSION))
+        for _ in range(antal):
+            (längd,) = _ARKIV_NAMN.unpack_from(self.mm, pos)
+            pos += _ARKIV_NAMN.size
+            namn = self.mm[pos:pos+längd].decode("utf-8")
+            pos += längd
+            self.index[namn] = _ARKIV_POST.unpack_from(self.mm, pos)
+            pos += _ARKIV_POST.size
+
+    def _stäng(self):
+        # Tabeller som pekar in i filen får egna kopior
+        for t in self.tabeller.values():
+            if type(t.kurser) is not array:
+                kurser = array('d')
+                kurser.frombytes(t.kurser.tobytes())
+                t.kurser = kurser
+        for vy in reversed(self.vyer):
+            vy.release()
+        self.vyer = []
+        for mm in self.gamla:
+            mm.close()
+        self.gamla = []
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        self.index = {}
+
+    def close(self):
+        super().close()
+        self._stäng()
+
+    def _vy(self, start, slut):
+        vy = memoryview(self.mm)
+        bit = vy[start:slut]
+        self.vyer += [vy, bit]
+        return bit
+
+    def _arkiverade(self, valuta):
+        """Valutans kurser i filen som (start, array), None om den saknas"""
+        post = self.index.get(valuta)
+        if post is None:
+            return None
+        start, antal, offset = post
+        kurser = array('d')
+        kurser.frombytes(self._vy(offset, offset + 8 * antal))
+        if sys.byteorder != "little":
+            kurser.byteswap()
+        return start, kurser
+
+    def _alla(self, valuta):
+        """Valutans kurser i filen och i minnet som (start, array)"""
+        arkiv = self._arkiverade(valuta)
+        nya = [(dagindex(d), k) for d, k in self.nya.get(valuta, _INGA).items()]
+        dagar = [i for i, _ in nya]
+        if arkiv:
+            dagar += [arkiv[0], arkiv[0] + len(arkiv[1]) - 1]
+        if not dagar:
+            return 0, array('d')
+        start = min(dagar)
+        kurser = array('d', [SAKNAS]) * (max(dagar) + 1 - start)
+        if arkiv:
+            i = arkiv[0] - start
+            kurser[i:i+len(arkiv[1])] = arkiv[1]
+        for i, k in nya:
+            kurser[i - start] = k
+        return start, kurser
+
+    def _get(self, valuta, datum):
+        kurs = self.nya.get(valuta, _INGA).get(datum)
+        if kurs is not None:
+            return kurs
+        post = self.index.get(valuta)
+        if post is None:
+            return None
+        start, antal, offset = post
+        i = dagindex(datum) - start
+        if 0 <= i < antal:
+            kurs = struct.unpack_from("<d", self.mm, offset + 8 * i)[0]
+            if kurs == kurs:
+                return kurs
+        return None
+
+    def _put(self, valuta, datum, kurs):
+        self.nya.setdefault(valuta, {})[datum] = kurs
+
+    def tabell(self, valuta):
+        """Kurstabellen för valutan. Börjar arkivets kurser vid eller före
+        EPOK är tabellen en vy in i filen, annars en kopia med NaN först."""
+        t = self.tabeller.get(valuta)
+        if t is not None:
+            return t
+        t = self.tabeller[valuta] = Kurstabell()
+        post = self.index.get(valuta)
+        if post is not None:
+            start, antal, offset = post
+            if start <= 0 and sys.byteorder == "little":
+                t.kurser = self._vy(offset - 8 * start, offset + 8 * antal).cast("d")
+                self.vyer.append(t.kurser)
+            else:
+                _, kurser = self._arkiverade(valuta)
+                t.kurser = array('d', [SAKNAS]) * max(start, 0)
+                t.kurser += kurser[max(-start, 0):]
+        for datum, kurs in self.nya.get(valuta, _INGA).items():
+            t.put(datum, kurs)
+        return t
+
+    @staticmethod
+    def _indexdata(index):
+        """Indexet som bytes, valutorna i bokstavsordning"""
+        data = bytearray()
+        for v in sorted(index):
+            namn = v.encode("utf-8")
+            data += _ARKIV_NAMN.pack(len(namn)) + namn + _ARKIV_POST.pack(*index[v])
+        return bytes(data)
+
+    def _skriv(self):
+        if self.mm is None:
+            self._skriv_om()
+            return
+        index = dict(self.index)
+        på_plats = []   # (offset, kurs) för dagar som ryms i valutans avsnitt
+        tillägg = []    # (valuta, start, kurser), nya avsnitt sist i filen
+        for v, nya in self.nya.items():
+            post = index.get(v)
+            dagar = [(dagindex(d), k) for d, k in nya.items()]
+            if post and all(post[0] <= i < post[0] + post[1] for i, _ in dagar):
+                start, _, offset = post
+                på_plats += [(offset + 8 * (i - start), k) for i, k in dagar]
+            else:
+                tillägg.append((v, *self._alla(v)))
+        storlek = len(self.mm)
+        offset = slut = (storlek + 7) // 8 * 8
+        for v, start, kurser in tillägg:
+            index[v] = (start, len(kurser), offset)
+            offset += 8 * len(kurser)
+        indexdata = self._indexdata(index)
+        levande = (_ARKIV_HUVUD.size + len(indexdata)
+                   + sum(8 * antal for _, antal, _ in index.values()))
+        if 2 * levande < offset + len(indexdata):
+            self._skriv_om()
+            return
+        with open(self.filnamn, "r+b") as f:
+            for pos, kurs in på_plats:
+                f.seek(pos)
+                f.write(struct.pack("<d", kurs))
+            # Nya avsnitt och index efter det gamla indexet, som gäller tills
+            # huvudet skrivs sist
+            f.seek(storlek)
+            f.write(b"\0" * (slut - storlek))
+            for v, start, kurser in tillägg:
+                if sys.byteorder != "little":
+                    kurser.byteswap()
+                f.write(kurser.tobytes())
+            f.write(indexdata)
+            f.flush()
+            f.seek(0)
+            f.write(_ARKIV_HUVUD.pack(ARKIV_MAGI, ARKIV_VERSION, 0, len(index), offset))
+        self.nya = {}
+        self.index = index
+        # Vyer in i den gamla mappningen gäller fortfarande, den stängs med filen
+        self.gamla.append(self.mm)
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _skriv_om(self):
+        """Skriv hela arkivet på nytt utan skräp: huvud, kurser och index"""
+        valutor = sorted(set(self.index) | set(self.nya))
+        data = [(v, *self._alla(v)) for v in valutor]
+        offset = (_ARKIV_HUVUD.size + 7) // 8 * 8
+        index = {}
+        for v, start, kurser in data:
+            index[v] = (start, len(kurser), offset)
+            offset += 8 * len(kurser)
+        tmp = self.filnamn + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_ARKIV_HUVUD.pack(ARKIV_MAGI, ARKIV_VERSION, 0, len(index), offset))
+            f.write(b"\0" * ((_ARKIV_HUVUD.size + 7) // 8 * 8 - _ARKIV_HUVUD.size))
+            for v, start, kurser in data:
+                if sys.byteorder != "little":
+                    kurser.byteswap()
+                f.write(kurser.tobytes())
+            f.write(self._indexdata(index))
+        self._stäng()
+        os.replace(tmp, self.filnamn)
+        self.nya = {}
+        self._öppna()
+
+    def items(self):
+        for valuta in sorted(set(self.index) | set(self.nya)):
+            start, kurser = self._alla(valuta)
+            for i, kurs in enumerate(kurser):
+                if kurs == kurs:
+                    yield valuta, date.fromordinal(EPOK + start + i).isoformat(), kurs
+
+def open_cache(filnamn):
+    """Öppna kurscachen i det format som filändelsen anger"""
+    if filnamn.endswith((".sqlite", ".sqlite3", ".db")):
+        return SqliteKurscache(filnamn)
+    if filnamn.endswith(".kurs"):
+        return ArkivKurscache(filnamn)
+    return Kurscache(filnamn)
+
+_cache = None
+
+def cache():
+    """Returnera processens gemensamma kurscache (skapas vid första anropet)"""
+    global _cache
+    if _cache is None:
+        _cache = open_cache(CACHEFILE)
+        atexit.register(_cache.flush)
+    return _cache
+
+def stäng_cache():
+    """Skriv och stäng processens kurscache, nästa cache() öppnar den igen.
+    Görs t ex innan arbetsprocesser startas med fork, som inte får ärva en
+    öppen SQLite-anslutning."""
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        atexit.unregister(_cache.flush)
+        _cache = None
+
+def import_json(filnamn, cachefil=None):
+    """Läs in alla kurser från en json-fil i cachens format till cachen
+    (processens cache, eller cachefil om den anges)"""
+    c = open_cache(cachefil) if cachefil else cache()
+    # Skriv cachen en gång till sist, inte var FLUSH_BATCH:e kurs
+    batch, c.flush_batch = c.flush_batch, None
+    try:
+        for valuta, kurser in load(filnamn).items():
+            c.put_many(valuta, kurser)
+    finally:
+        c.flush_batch = batch
+        c.flush()
+
+def export_json(filnamn, cachefil=None):
+    """Skriv hela cachen (eller cachefil om den anges) till en json-fil i
+    cachens format"""
+    v = {}
+    c = open_cache(cachefil) if cachefil else cache()
+    for valuta, datum, kurs in c.items():
+        v.setdefault(valuta, {})[datum] = kurs
+    save(v, filnamn)
+
+def statistik():
+    """Antal cacheträffar och -missar hittills i processen"""
+    return cache().statistik()
+
+def prefetch(behov, arbetare=ARBETARE):
+    ''' Fyll cachen för alla (valuta, datum)-par i behov, t ex
+        [("usd", "2021-01-01"), ("bitcoin", "2021-03-11")], med så få anrop som
+        möjligt. Saknade datum hämtas per valuta som intervall om högst
+        MAX_INTERVALL dagar och alla dagar i intervallet sparas i cachen.
+        Intervallen hämtas parallellt med upp till arbetare trådar.
+        Dagens datum och datum som inte gick att hämta slås upp som vanligt i lookup().
+    '''
+    c = cache()
+    idag = datetime.now().date().isoformat()
+    saknas = {}
+    for valuta, datum in set(behov):
+        if datum < idag and not c.has(valuta, datum):
+            saknas.setdefault(valuta, []).append(datum)
+    jobb = [(valuta, start, slut) for valuta, datumlista in saknas.items()
+            for start, slut in date_ranges(sorted(datumlista), MAX_INTERVALL)]
+
+    def hämta(j):
+        valuta, start, slut = j
+        if valuta in FIAT:
+            return valuta, fetch_fiat_range(start, slut, valuta)   # kurser i SEK
+        return valuta, fetch_crypto_range(start, slut, valuta)     # kurser i USD
+
+    # Cachen uppdateras bara från denna tråd, ett intervall i taget. Fel
+    # från trådarna kastas vidare av pool.map och avslutar programmet här,
+    # efter att de kurser som redan hämtats har sparats. Cachen skrivs en
+    # gång till sist, inte var FLUSH_BATCH:e kurs, även vid fel.
+    batch, c.flush_batch = c.flush_batch, None
+    try:
+        with ThreadPoolExecutor(max_workers=arbetare) as pool:
+            try:
+                for valuta, kurser in pool.map(hämta, jobb):
+                    c.put_many(valuta, {datum: kurs for datum, kurs in kurser.items()
+                                        if datum < idag and not c.has(valuta, datum)})
+            except HämtningsFel as e:
+                pool.shutdown(cancel_futures=True)
+                sys.exit("Error: " + str(e))
+    finally:
+        c.flush_batch = batch
+        c.flush()
+
+class TokenBucket:
+    """Hastighetsbegränsning: takt polletter per sekund fylls på, högst skur
+    sparas. take() väntar tills en pollett finns. Trådsäker."""
+    def __init__(self, takt, skur):
+        self.takt = takt
+        self.skur = skur
+        self.polletter = skur
+        self.senast = time.monotonic()
+        self.lås = threading.Lock()
+
+    def take(self):
+        with self.lås:
+            nu = time.monotonic()
+            self.polletter = min(self.skur, self.polletter + (nu - self.senast) * self.takt)
+            self.senast = nu
+            vänta = (1 - self.polletter) / self.takt if self.polletter < 1 else 0
+            # Polletten reserveras direkt, även om vi måste vänta på den
+            self.polletter -= 1
+        if vänta > 0:
+            time.sleep(vänta)
+
+_buckets = {leverantör: TokenBucket(*kvot) for leverantör, kvot in KVOTER.items()}
+
+# Antal nätverksanrop och tid i dem, för tidtagning.py. Uppdateras från
+# prefetch-trådarna, därav låset.
+nätverk = {"anrop": 0, "tid": 0.0}
+_nätverk_lås = threading.Lock()
+
+def nollställ_nätverk():
+    """Nollställ nätverksräknarna, t ex i en arbetsprocess som återanvänds"""
+    with _nätverk_lås:
+        nätverk["anrop"] = 0
+        nätverk["tid"] = 0.0
+
+def retry_after(värde, standard):
+    """Sekunder att vänta enligt Retry-After, som är antingen ett antal
+    sekunder eller ett HTTP-datum. standard om värdet saknas eller inte går
+    att tolka."""
+    if not värde:
+        return standard
+    try:
+        return max(0.0, float(värde))
+    except ValueError:
+        pass
+    try:
+        tid = email.utils.parsedate_to_datetime(värde)
+    except (TypeError, ValueError):
+        return standard
+    if tid.tzinfo is None:
+        tid = tid.replace(tzinfo=timezone.utc)
+    return max(0.0, (tid - datetime.now(timezone.utc)).total_seconds())
+
+class HämtningsFel(Exception):
+    """Leverantören svarade utan kurser. Kastas i prefetch-trådarna, där
+    sys.exit() bara skulle avsluta tråden."""
+
+def get_json(url, leverantör):
+    ''' Hämta url via http_get med leverantörens hastighetsbegränsning.
+        Vid 429 väntas Retry-After sekunder (annars 1, 2, 4... s) och anropet görs om. '''
+    for försök in range(MAX_FÖRSÖK):
+        _buckets[leverantör].take()
+        t0 = time.perf_counter()
+        response = http_get(url)
+        dt = time.perf_counter() - t0
+        with _nätverk_lås:
+            nätverk["anrop"] += 1
+            nätverk["tid"] += dt
+        if response.status_code != 429:
+            break
+        vänta = retry_after(response.headers.get("Retry-After"), 2 ** försök)
+        print(f"För många anrop till {leverantör}, väntar {vänta} s och försöker igen")
+        time.sleep(vänta)
+    return response.json()
+
+def date_ranges(datumlista, maxdagar):
+    ''' Dela en sorterad lista med ISO-datum i intervall (start, slut) som
+        täcker alla datum och är högst maxdagar långa. '''
+    intervall = []
+    for datum in datumlista:
+        dt = date.fromisoformat(datum)
+        if intervall and (dt - intervall[-1][0]).days < maxdagar:
+            intervall[-1][1] = dt
+        else:
+            intervall.append([dt, dt])
+    return [(start.isoformat(), slut.isoformat()) for start, slut in intervall]
+
+def fetch_fiat_range(start, slut, valuta):
+    ''' Returnera dict datum -> kurs i SEK för alla dagar från start till och med slut. '''
+    url = (f"{CURRENCYBEACON_URL}timeseries?base={valuta.upper()}&symbols=SEK"
+           f"&start_date={start}&end_date={slut}&api_key={APIKEY_CURRENCYBEACON}")
+    print("Hämtar kurser", start, "-", slut, "för", valuta, "från currencybeacon!")
+    data = get_json(url, "currencybeacon")
+    if not "response" in data:
+        raise HämtningsFel(f"inga kurser för {valuta} {start} - {slut} från currencybeacon: {data}")
+    return {datum: kurser["SEK"] for datum, kurser in data["response"].items()
+            if "SEK" in kurser}
+
+def fetch_crypto_range(start, slut, coinid):
+    ''' Returnera dict datum -> kurs i USD för dagarna från start till och med slut.
+        Coingecko ger en kurs per dag (kl 00:00 UTC) för långa intervall och per
+        timme för korta, första kursen efter midnatt används för varje datum. '''
+    t0 = datetime.fromisoformat(start).replace(tzinfo=timezone.utc)
+    t1 = datetime.fromisoformat(slut).replace(tzinfo=timezone.utc) + timedelta(days=1)
+    url = (f"{COINGECKO_URL}coins/{coinid}/market_chart/range?vs_currency=usd"
+           f"&from={int(t0.timestamp())}&to={int(t1.timestamp())}"
+           f"&x_cg_demo_api_key={APIKEY_COINGECKO}")
+    print("Hämtar kurser", start, "-", slut, "för", coinid, "från coingecko.com!")
+    data = get_json(url, "coingecko")
+    if not "prices" in data:
+        print("Unknown error:", data)
+        return {}
+    kurser = {}
+    for ms, kurs in data["prices"]:
+        datum = datetime.fromtimestamp(ms / 1000, timezone.utc).date().isoformat()
+        kurser.setdefault(datum, kurs)
+    return kurser
+
+def load(filnamn=CACHEFILE):
     """ Läs in redan hämtade valutor från cachefilen. """
     v = {}
     try:
-        with open(CACHEFILE, "r") as f:
+        with open(filnamn, "r") as f:
             v = json.load(f)
     except FileNotFoundError:
-        print("Varning: hittar ej", CACHEFILE, "- skapar ny!")
+        print("Varning: hittar ej", filnamn, "- skapar ny!")
     return v
 
-def save(v):
-    """ Spara hämtade valutor till nästa gång. """
-    with open(CACHEFILE, "w") as f:
+def save(v, filnamn=CACHEFILE):
+    """ Spara hämtade valutor till nästa gång. Skriver först till en
+        temporär fil och byter sedan namn, så att cachefilen aldrig blir halvskriven. """
+    tmp = filnamn + ".tmp"
+    with open(tmp, "w") as f:
         json.dump(v, f)
+    os.replace(tmp, filnamn)
 
 if __name__ == "__main__":
     main()